@@ -802,6 +802,9 @@ Now put it all together to build a multi-function calculator. Use the menu and t
 """
 
 import math
+from array import array
+from functools import lru_cache
+from itertools import groupby, islice
 from sympy import symbols, Eq, solve
 
 # Write your code here
@@ -836,42 +839,186 @@ def division(list_of_arguments):
             return ZeroDivisionError("Error: Can't divide by zero.")
     return division_output
 
+# numbers below this bound are tested and factored with the smallest prime factor table, which is grown lazily
+# up to the largest number asked for (4 bytes per number, so about 40 MB at the bound)
+SIEVE_LIMIT = 10**7
+# smallest prime factor of every number below len(smallest_prime_factors), 0 for the primes (and for 0 and 1)
+smallest_prime_factors = array("I", [0, 0])
+
+def grow_sieve(number):
+    # extending the table to cover the number: segments are sieved with the primes up to their square root,
+    # which are all below low and so already in the table, because the table at most doubles
+    # (2 * low - 1 < low**2 for every low >= 2, the table starts with 0 and 1). It never grows past SIEVE_LIMIT,
+    # larger numbers are handled without the table.
+    number = min(number, SIEVE_LIMIT - 1)
+    while len(smallest_prime_factors) <= number:
+        low = len(smallest_prime_factors)
+        high = min(2 * low, SIEVE_LIMIT)
+        if high <= low:
+            break
+        smallest_prime_factors.extend(array("I", [0]) * (high - low))
+        sieving_primes = [p for p in range(2, math.isqrt(high - 1) + 1) if smallest_prime_factors[p] == 0]
+        # the larger primes are written first, so every number ends up with its smallest prime factor
+        for p in reversed(sieving_primes):
+            start = max(p * p, -(-low // p) * p)
+            if start < high:
+                smallest_prime_factors[start:high:p] = array("I", [p]) * len(range(start, high, p))
+
+# primes of the table in order, collected as far as trial division needed them
+table_primes = []
+
+def trial_divisors(limit):
+    # candidate factors up to limit: the primes of the table, then the odd numbers above it
+    table_limit = min(limit, SIEVE_LIMIT - 1)
+    grow_sieve(table_limit)
+    start = table_primes[-1] + 1 if table_primes else 2
+    table_primes.extend(p for p in range(start, table_limit + 1) if smallest_prime_factors[p] == 0)
+    for p in table_primes:
+        if p > limit:
+            return
+        yield p
+    yield from range(SIEVE_LIMIT | 1, limit + 1, 2)
+
+# with these bases the Miller-Rabin test is deterministic for every number below 3.3 * 10**24 (so all 64-bit ones)
+MILLER_RABIN_BASES = (2, 3, 5, 7, 11, 13, 17, 19, 23, 29, 31, 37, 41)
+# large numbers are trial divided only up to this bound before Pollard's rho takes over
+SMALL_FACTOR_BOUND = 1000
+
+@lru_cache(maxsize=65536)
+def miller_rabin(number):
+    # primality test of an odd number above the bases (strong probable prime above 3.3 * 10**24)
+    d, s = number - 1, 0
+    while d % 2 == 0:
+        d //= 2
+        s += 1
+    for base in MILLER_RABIN_BASES:
+        x = pow(base, d, number)
+        if x == 1 or x == number - 1:
+            continue
+        for _ in range(s - 1):
+            x = x * x % number
+            if x == number - 1:
+                break
+        else:
+            return False
+    return True
+
+def pollard_brent(number):
+    # a nontrivial factor of an odd composite number, Brent's variant of Pollard's rho with the gcd taken once
+    # per 128 steps; a failed cycle is repeated step by step, then with the next polynomial x**2 + c
+    for c in range(1, number):
+        y, r, q, g = 2, 1, 1, 1
+        while g == 1:
+            x = y
+            for _ in range(r):
+                y = (y * y + c) % number
+            k = 0
+            while k < r and g == 1:
+                saved_y = y
+                for _ in range(min(128, r - k)):
+                    y = (y * y + c) % number
+                    q = q * abs(x - y) % number
+                g = math.gcd(q, number)
+                k += 128
+            r *= 2
+        if g == number:
+            g = 1
+            while g == 1:
+                saved_y = (saved_y * saved_y + c) % number
+                g = math.gcd(abs(x - saved_y), number)
+        if g != number:
+            return g
+
+@lru_cache(maxsize=4096)
+def large_prime_factors(number):
+    # sorted prime factors of a number without factors up to SMALL_FACTOR_BOUND: it is split with Pollard's rho
+    # until Miller-Rabin (or the already grown table) says the parts are prime
+    factors = []
+    cofactors = [number] if number > 1 else []
+    while cofactors:
+        number = cofactors.pop()
+        if number < len(smallest_prime_factors):
+            while number > 1:
+                factors.append(smallest_prime_factors[number] or number)
+                number //= factors[-1]
+        elif number < SMALL_FACTOR_BOUND**2 or miller_rabin(number):
+            factors.append(number)
+        else:
+            factor = pollard_brent(number)
+            cofactors += [factor, number // factor]
+    return tuple(sorted(factors))
+
 def prime_or_not(number):
     try:
         number = int(number)
     except ValueError:
         return "Invalid input"
-    if number == 2:
-        return True
-    if number == 1 or number % 2 == 0:
+    if number < 2:
         return False
-    for test_factor in range (3, int(math.sqrt(number))+1, 2):
-        if number % test_factor == 0:
-            return False
-    return True
+    # the table below the bound, Miller-Rabin above it
+    if number < SIEVE_LIMIT:
+        grow_sieve(number)
+        return smallest_prime_factors[number] == 0
+    return number % 2 == 1 and miller_rabin(number)
+
+def prime_factor_powers(number):
+    # (prime, exponent) pairs of the factorization of number in increasing order, generated one at a time:
+    # below the bound from the table; above it by trial division, which goes on from the last candidate instead
+    # of starting again after every factor, and Pollard's rho for what is left
+    number = int(number)
+    if number >= SIEVE_LIMIT:
+        for test_factor in trial_divisors(SMALL_FACTOR_BOUND):
+            if test_factor * test_factor > number or number < SIEVE_LIMIT:
+                break
+            exponent = 0
+            while number % test_factor == 0:
+                number //= test_factor
+                exponent += 1
+            if exponent:
+                yield test_factor, exponent
+    if number < SIEVE_LIMIT:
+        grow_sieve(number)
+        while number > 1:
+            prime = smallest_prime_factors[number] or number
+            exponent = 0
+            while number % prime == 0:
+                number //= prime
+                exponent += 1
+            yield prime, exponent
+    else:
+        for prime, group in groupby(large_prime_factors(number)):
+            yield prime, len(list(group))
+
+def prime_factor_batch(numbers, chunk_size=10000):
+    # (number, [(prime, exponent), ...]) of every number of an iterable, "Invalid input" instead of the list for
+    # the ones which aren't integers. The numbers are read in chunks: the table is grown once for the largest
+    # number of the chunk below the bound and repeated numbers of a chunk are factored once.
+    numbers = iter(numbers)
+    while chunk := list(islice(numbers, chunk_size)):
+        parsed_numbers = []
+        for number in chunk:
+            try:
+                parsed_numbers.append(int(number))
+            except (TypeError, ValueError):
+                parsed_numbers.append(None)
+        grow_sieve(max([number for number in parsed_numbers if number is not None and number < SIEVE_LIMIT],
+                       default=0))
+        factorizations = {}
+        for number, parsed_number in zip(chunk, parsed_numbers):
+            if parsed_number is None:
+                yield number, "Invalid input"
+                continue
+            if parsed_number not in factorizations:
+                factorizations[parsed_number] = list(prime_factor_powers(parsed_number))
+            yield number, factorizations[parsed_number]
 
 def prime_factors(number, prime_factor_list):
     try:
         number = int(number)
     except ValueError:
         return "Invalid input"
-    # ending the recursion
-    if number == 1 or number == 0:
-        return prime_factor_list
-    # checking if number is divisable for 2
-    while number % 2 == 0:
-        prime_factor_list.append(2)
-        number //= 2
-    # limiting range to just odd numbers
-    for argument in range (3, int(math.sqrt(number))+1, 2):
-        if not prime_or_not(argument):
-            continue
-        if number % argument == 0:
-            prime_factor_list.append(argument)
-            return prime_factors(number // argument, prime_factor_list)        
-    # adding exception for prime factors greater than its root
-    if number > 2:
-        prime_factor_list.append(number)
+    for prime, exponent in prime_factor_powers(number):
+        prime_factor_list.extend([prime] * exponent)
     return prime_factor_list
 
 def simplify_sqrt(number):
@@ -0,0 +1,89 @@
+import math
+from pathlib import Path
+
+import pytest
+
+# multi_function_calculator.py is a notebook export that runs its menus on import, so only the prime functions of the
+# Step 30 section are executed here (sympy is not needed by them)
+SOURCE = (Path(__file__).parent / "multi_function_calculator.py").read_text()
+STEP_30 = SOURCE[SOURCE.index('"""# Step 30 - Certification Project 1'):]
+PRIME_FUNCTIONS = STEP_30[STEP_30.index("import math"):STEP_30.index("def simplify_sqrt(number):")]
+calculator = {}
+exec(PRIME_FUNCTIONS.replace("from sympy import symbols, Eq, solve\n", ""), calculator)
+
+
+def naive_factors(number):
+    factors, divisor = [], 2
+    while divisor * divisor <= number:
+        while number % divisor == 0:
+            factors.append(divisor)
+            number //= divisor
+        divisor += 1
+    if number > 1:
+        factors.append(number)
+    return factors
+
+
+def test_grow_sieve_smallest_prime_factors():
+    calculator["grow_sieve"](20000)
+    table = calculator["smallest_prime_factors"]
+    assert len(table) > 20000
+    for number in range(2, 20001):
+        smallest = naive_factors(number)[0]
+        assert table[number] == (0 if smallest == number else smallest), number
+
+
+def test_grow_sieve_stops_at_the_limit(monkeypatch):
+    table = calculator["smallest_prime_factors"]
+    calculator["grow_sieve"](1000)
+    limit = len(table) + 100
+    monkeypatch.setitem(calculator, "SIEVE_LIMIT", limit)
+    calculator["grow_sieve"](10**12)
+    assert len(table) == limit
+    # a limit lowered below the table leaves it as it is
+    monkeypatch.setitem(calculator, "SIEVE_LIMIT", limit // 2)
+    calculator["grow_sieve"](limit)
+    assert len(table) == limit
+    assert calculator["prime_factors"](limit - 1, []) == naive_factors(limit - 1)
+
+
+@pytest.mark.parametrize("number, expected", [
+    (3215031751, False), (3825123056546413051, False), (318665857834031151167461, False),
+    (2**61 - 1, True), (2**64 - 59, True), (10**9 + 7, True), (561, False),
+])
+def test_miller_rabin_strong_pseudoprimes(number, expected):
+    assert calculator["miller_rabin"](number) is expected
+    assert calculator["prime_or_not"](number) is expected
+
+
+@pytest.mark.parametrize("number", [1000003 * 1000033, 2147496017 * 4294967311, 3215031751, 2**64 - 1])
+def test_pollard_brent_finds_a_factor(number):
+    factor = calculator["pollard_brent"](number)
+    assert 1 < factor < number and number % factor == 0
+
+
+@pytest.mark.parametrize("number", list(range(0, 2000)) + [
+    9999991, 10**7, 10**7 + 1, 2**32 + 1, 600851475143, 10**20, 2**64 - 1, 1000000007 * 10000000019,
+])
+def test_prime_factors_match_trial_division(number):
+    expected = naive_factors(number) if number < 10**13 else None
+    factors = calculator["prime_factors"](number, [])
+    if expected is not None:
+        assert factors == expected
+    assert math.prod(factors) == max(number, 1) and factors == sorted(factors)
+    assert all(calculator["prime_or_not"](factor) for factor in factors)
+    assert list(calculator["prime_factor_powers"](number)) == [(prime, factors.count(prime))
+                                                                for prime in sorted(set(factors))]
+
+
+def test_prime_factor_batch_chunks_and_invalid_input():
+    numbers = [12, "x", 12, 10**7 + 1, "97", None, 1]
+    batch = list(calculator["prime_factor_batch"](numbers, chunk_size=2))
+    assert batch == [(12, [(2, 2), (3, 1)]), ("x", "Invalid input"), (12, [(2, 2), (3, 1)]),
+                     (10**7 + 1, [(11, 1), (909091, 1)]), ("97", [(97, 1)]), (None, "Invalid input"), (1, [])]
+
+
+def test_prime_factors_invalid_input():
+    assert calculator["prime_factors"]("x", []) == "Invalid input"
+    assert calculator["prime_or_not"]("x") == "Invalid input"
+    assert calculator["prime_factors"]("12", [1]) == [1, 2, 2, 3]
@@ -1,4 +1,26 @@
+import asyncio
+import csv
+import heapq
+import itertools
+import json
 import math
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, insort
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+from itertools import islice
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 class InvalidAmountError(Exception):
@@ -13,109 +35,1166 @@ class InvalidCategoryError(Exception):
     pass
 
 
+class InvalidTimestampError(Exception):
+    pass
+
+
+class InvalidCurrencyError(Exception):
+    pass
+
+
+class LedgerView:
+    # read-only list-of-dicts view of the columnar ledger of a Category, the dicts are built on access
+
+    def __init__(self, category):
+        self._category = category
+
+    def __len__(self):
+        return len(self._category._amounts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._entry(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("ledger index out of range")
+        return self._entry(index)
+
+    def __iter__(self):
+        descriptions = self._category._description_table
+        for cents, description_index in zip(self._category._amounts, self._category._descriptions):
+            yield {"amount": cents / 100, "description": descriptions[description_index]}
+
+    def __eq__(self, other):
+        if isinstance(other, (list, LedgerView)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def _entry(self, index):
+        category = self._category
+        return {"amount": category._amounts[index] / 100,
+                "description": category._description_table[category._descriptions[index]]}
+
+
+class LedgerQuery:
+    # secondary indexes over the ledger of a Category for interactive queries, see Category.query.
+    #
+    # The amounts are kept in a bucketed sorted list: sorted buckets of up to 2 * _BUCKET_SIZE keys (amount in cents
+    # in the high bits, ledger position in the low 32 bits) with the maximum key of every bucket and Fenwick trees
+    # of the bucket sums and lengths, so a range sum or count only looks inside the two buckets at its ends and
+    # takes O(log(n / B) + B) steps for buckets of B keys. The descriptions have a trigram
+    # index of their lowercase text and use the positions of Category.index_descriptions, and with timestamps=True
+    # the prefix sums of the amounts are kept for sums over time ranges. The indexes are brought up to date with
+    # the entries appended since the last query when they are used, under the lock of a ThreadSafeCategory.
+
+    _BUCKET_SIZE = 1024
+
+    def __init__(self, category, timestamps=False):
+        self.category = category
+        self._buckets = []
+        self._bucket_maxes = []
+        self._bucket_sums = []
+        self._trigrams = {}
+        self._trigram_count = 0
+        self._amount_prefix = array("q") if timestamps else None
+        self._count = 0
+
+        # the existing ledger is sorted once and split into buckets
+        amounts = category._amounts
+        keys = sorted((cents << 32) | position for position, cents in enumerate(amounts))
+        for start in range(0, len(keys), self._BUCKET_SIZE):
+            bucket = keys[start:start + self._BUCKET_SIZE]
+            self._buckets.append(bucket)
+            self._bucket_maxes.append(bucket[-1])
+            self._bucket_sums.append(sum(key >> 32 for key in bucket))
+        self._count = len(keys)
+        self._rebuild_trees()
+        if timestamps:
+            self._amount_prefix.extend(itertools.accumulate(amounts))
+        self._update()
+
+    def sum_range(self, min_amount=None, max_amount=None):
+        # sum of the amounts between min_amount and max_amount (both inclusive, None means no limit)
+        with _locked(self.category):
+            self._update()
+            low, high = self._key_range(min_amount, max_amount)
+            return (self._sum_below(high) - self._sum_below(low)) / 100
+
+    def count_range(self, min_amount=None, max_amount=None):
+        # number of the amounts between min_amount and max_amount (both inclusive, None means no limit)
+        with _locked(self.category):
+            self._update()
+            low, high = self._key_range(min_amount, max_amount)
+            return self._count_below(high) - self._count_below(low)
+
+    def top_spends(self, k):
+        # the k largest withdrawals as ledger entries, the largest first (earlier entries first on ties)
+        with _locked(self.category):
+            self._update()
+            spends = []
+            for bucket in self._buckets:
+                for key in bucket:
+                    if key >= 0 or len(spends) == k:
+                        return spends
+                    spends.append(self.category.ledger[key & 0xFFFFFFFF])
+            return spends
+
+    def search(self, text, limit=None):
+        # ledger entries whose description contains text (case-insensitive), in ledger order; only the
+        # descriptions having all the trigrams of text are checked
+        with _locked(self.category):
+            self._update()
+            text = text.lower()
+            table = self.category._description_table
+            if len(text) < 3:
+                candidates = range(len(table))
+            else:
+                candidate_sets = [self._trigrams.get(text[i:i + 3], set()) for i in range(len(text) - 2)]
+                candidates = set.intersection(*sorted(candidate_sets, key=len))
+            positions = self.category._description_positions
+            matching = [positions[index] for index in sorted(candidates) if text in table[index].lower()]
+            ledger = self.category.ledger
+            return [ledger[position] for position in islice(heapq.merge(*matching), limit)]
+
+    def sum_between(self, since=None, until=None):
+        # sum of the amounts posted at or after since and before until (None means no limit)
+        with _locked(self.category):
+            self._update()
+            timestamps = self.category._timestamps
+            start = 0 if since is None else bisect_left(timestamps, since)
+            end = len(timestamps) if until is None else bisect_left(timestamps, until)
+            if start >= end:
+                return 0.0
+            if self._amount_prefix is None:
+                return sum(islice(self.category._amounts, start, end)) / 100
+            return (self._amount_prefix[end - 1] - (self._amount_prefix[start - 1] if start else 0)) / 100
+
+    def _update(self):
+        category = self.category
+        amounts = category._amounts
+        for position in range(self._count, len(amounts)):
+            self._insert((amounts[position] << 32) | position)
+            if self._amount_prefix is not None:
+                self._amount_prefix.append((self._amount_prefix[-1] if position else 0) + amounts[position])
+        self._count = len(amounts)
+
+        table = category._description_table
+        for index in range(self._trigram_count, len(table)):
+            description = table[index].lower()
+            for i in range(len(description) - 2):
+                self._trigrams.setdefault(description[i:i + 3], set()).add(index)
+        self._trigram_count = len(table)
+        category.index_descriptions()
+
+    def _insert(self, key):
+        if not self._buckets:
+            self._buckets.append([key])
+            self._bucket_maxes.append(key)
+            self._bucket_sums.append(key >> 32)
+            self._rebuild_trees()
+            return
+        index = min(bisect_left(self._bucket_maxes, key), len(self._buckets) - 1)
+        bucket = self._buckets[index]
+        insort(bucket, key)
+        self._bucket_maxes[index] = bucket[-1]
+        self._bucket_sums[index] += key >> 32
+        if len(bucket) > 2 * self._BUCKET_SIZE:
+            # splitting the full bucket in halves; it shifts the later buckets, so the trees are built again, which
+            # happens once per _BUCKET_SIZE inserts at most
+            half = bucket[self._BUCKET_SIZE:]
+            del bucket[self._BUCKET_SIZE:]
+            self._buckets.insert(index + 1, half)
+            self._bucket_maxes[index:index + 1] = [bucket[-1], half[-1]]
+            half_sum = sum(half_key >> 32 for half_key in half)
+            self._bucket_sums[index:index + 1] = [self._bucket_sums[index] - half_sum, half_sum]
+            self._rebuild_trees()
+        else:
+            self._tree_add(index, key >> 32)
+
+    def _rebuild_trees(self):
+        # Fenwick trees of the bucket sums and the bucket lengths (1-based), built in O(number of buckets)
+        self._sum_tree = [0] + self._bucket_sums
+        self._count_tree = [0] + [len(bucket) for bucket in self._buckets]
+        for tree in (self._sum_tree, self._count_tree):
+            for index in range(1, len(tree)):
+                parent = index + (index & -index)
+                if parent < len(tree):
+                    tree[parent] += tree[index]
+
+    def _tree_add(self, index, cents):
+        # one more key with the amount cents in the bucket index
+        index += 1
+        while index < len(self._sum_tree):
+            self._sum_tree[index] += cents
+            self._count_tree[index] += 1
+            index += index & -index
+
+    @staticmethod
+    def _tree_prefix(tree, index):
+        # total of the first index buckets
+        total = 0
+        while index:
+            total += tree[index]
+            index &= index - 1
+        return total
+
+    @staticmethod
+    def _key_range(min_amount, max_amount):
+        # keys of the first entry with amount min_amount and of the first entry above max_amount, an empty range
+        # when min_amount is above max_amount
+        low = -2 ** 63 if min_amount is None else _parse_cents(min_amount)
+        high = 2 ** 63 - 1 if max_amount is None else _parse_cents(max_amount)
+        return low << 32, max(low, high + 1) << 32
+
+    def _position(self, key):
+        # bucket and position in it of the first key at or above key
+        index = bisect_left(self._bucket_maxes, key)
+        if index == len(self._buckets):
+            return index, 0
+        return index, bisect_left(self._buckets[index], key)
+
+    def _sum_below(self, key):
+        # sum of the amounts of the keys below key: the whole buckets from the tree, O(log(n / B) + B)
+        index, position = self._position(key)
+        below = self._tree_prefix(self._sum_tree, index)
+        if index == len(self._buckets):
+            return below
+        return below + sum(lower >> 32 for lower in self._buckets[index][:position])
+
+    def _count_below(self, key):
+        index, position = self._position(key)
+        return self._tree_prefix(self._count_tree, index) + position
+
+
 class Category:
+    # LedgerJournal the entries are written to, see LedgerJournal.attach
+    _journal = None
 
     def __init__(self, category=""):
         self.category = str(category)
-        self.ledger = []
-        self.category_spending_sum = 0
+        # columnar ledger: amounts in integer cents and descriptions as indexes into a table of unique strings
+        self._amounts = array("q")
+        self._descriptions = array("I")
+        self._description_table = []
+        self._description_indexes = {}
+        self._balance_cents = 0
+        # posting time of every entry (non-decreasing) and the total spending in cents up to and including it
+        self._timestamps = array("d")
+        self._spending_prefix = array("q")
+        self._spending_cents = 0
+        # rendering cache of __str__: the formatted lines of the first _rendered_count entries, their amount width
+        # and the whole string with the number of entries and the name it was rendered for
+        self._rendered_lines = ""
+        self._rendered_width = 0
+        self._rendered_count = 0
+        self._rendered = None
+        self._width = 0
+        self._width_count = 0
+        # optional description index, see index_descriptions, and secondary indexes, see query
+        self._description_positions = None
+        self._query = None
+
+    @property
+    def ledger(self):
+        return LedgerView(self)
+
+    @property
+    def category_spending_sum(self):
+        # total of all the withdrawals, transfers to other categories included
+        return self._spending_cents / 100
+
+    def spending_since(self, timestamp, until=None):
+        # total of the withdrawals posted at or after timestamp (and before until), two binary searches
+        # over the timestamps and a difference of the spending prefix sums
+        start = bisect_left(self._timestamps, timestamp)
+        end = len(self._timestamps) if until is None else bisect_left(self._timestamps, until)
+        if start >= end:
+            return 0.0
+        return (self._spending_prefix[end - 1] - (self._spending_prefix[start - 1] if start else 0)) / 100
 
     def __repr__(self):
         self.get_balance()
 
     def __str__(self):
-        if not self.ledger:
+        if not self._amounts:
             return f"{self.category.center(30, '*')}\nTotal: 0"
-        ledger_string = [self.category.center(30, "*")]
-        # finding max length of the monetary value: takes each item, checks its length and find maximum
-        monetary_limit = max(len(f"{item['amount']:.2f}") for item in self.ledger)
+        if self._rendered is None or self._rendered[0] != (len(self._amounts), self.category):
+            self._rendered = ((len(self._amounts), self.category),
+                              f"{self.category.center(30, '*')}\n{self._render_lines()}Total: {self.get_balance()}")
+        return self._rendered[1]
+
+    def _render_lines(self):
+        # the formatted ledger lines are cached and only the entries appended since the last call are formatted;
+        # everything is formatted again only when a new amount is wider than all the earlier ones
+        amounts = self._amounts
+        start = self._rendered_count
+        if start == len(amounts):
+            return self._rendered_lines
+        monetary_limit = self._amount_width()
+        if monetary_limit != self._rendered_width:
+            start, self._rendered_lines, self._rendered_width = 0, "", monetary_limit
 
         # creating left and right sides of the output string, at least one whitespace inbetween
         description_limit = 30 - 1 - monetary_limit
-        for item in self.ledger:
-            ledger_amount = f"{float(item['amount']):{monetary_limit}.2f}"
-            ledger_description = f"{item['description'][0:description_limit]:{description_limit}}"
-            ledger_string.append(f"{ledger_description} {ledger_amount}")
+        descriptions = self._description_table
+        self._rendered_lines += "".join(
+            [f"{descriptions[description_index][0:description_limit]:{description_limit}} "
+             f"{cents / 100:{monetary_limit}.2f}\n"
+             for cents, description_index in zip(islice(amounts, start, None),
+                                                 islice(self._descriptions, start, None))])
+        self._rendered_count = len(amounts)
+        return self._rendered_lines
+
+    def _amount_width(self):
+        # length of the longest formatted amount of the ledger, updated with the entries appended since the last
+        # call; the longest one is always the one of the smallest or of the largest amount
+        with _locked(self):
+            amounts = self._amounts
+            if self._width_count < len(amounts):
+                new_amounts = amounts[self._width_count:]
+                self._width = max(self._width, len(f"{min(new_amounts) / 100:.2f}"),
+                                  len(f"{max(new_amounts) / 100:.2f}"))
+                self._width_count = len(amounts)
+            return self._width
+
+    def ledger_lines(self, offset=0, limit=None, description_prefix=None, min_amount=None, max_amount=None):
+        # streams the ledger lines of __str__ (same 30 columns and amount width, without the title and the total)
+        # of the entries whose description starts with description_prefix and whose amount is between min_amount
+        # and max_amount (both inclusive), skipping the first offset of them and stopping after limit lines
+        monetary_limit = self._amount_width()
+        description_limit = 30 - 1 - monetary_limit
+        amounts, descriptions, table = self._amounts, self._descriptions, self._description_table
+        stop = None if limit is None else offset + limit
+        positions = self._matching_positions(description_prefix, min_amount, max_amount)
+        # without filters the page is found directly, otherwise the matching entries before it are skipped
+        positions = positions[offset:stop] if isinstance(positions, range) else islice(positions, offset, stop)
+        for position in positions:
+            yield (f"{table[descriptions[position]][0:description_limit]:{description_limit}} "
+                   f"{amounts[position] / 100:{monetary_limit}.2f}")
 
-        # adding total balance
-        ledger_string.append(f"Total: {self.get_balance()}")
-        final_string = '\n'.join(ledger_string)
-        return final_string
+    def ledger_page(self, page, page_size=100, **filters):
+        # lines of the page-th (from 0) page of page_size lines of ledger_lines, filters as in ledger_lines
+        return list(self.ledger_lines(page * page_size, page_size, **filters))
 
-    def deposit(self, amount, description=""):
+    def index_descriptions(self):
+        # optional index for the description_prefix filter of ledger_lines: the descriptions in sorted order and
+        # the ledger positions of every description, so only the matching entries are visited. It is brought up
+        # to date with the appended entries whenever it is used.
+        with _locked(self):
+            if self._description_positions is None:
+                self._description_positions = []
+                self._sorted_descriptions = []
+                self._positions_count = 0
+            table, positions, sorted_descriptions = (self._description_table, self._description_positions,
+                                                     self._sorted_descriptions)
+            new_descriptions = [(table[description_index], description_index)
+                                for description_index in range(len(positions), len(table))]
+            positions.extend(array("Q") for _ in new_descriptions)
+            # a few new descriptions are inserted one by one; a larger batch is appended and merged by one sort,
+            # which finds the two sorted runs, so indexing D unique descriptions stays O(D log D)
+            if len(new_descriptions) <= 16:
+                for description in new_descriptions:
+                    insort(sorted_descriptions, description)
+            else:
+                new_descriptions.sort()
+                sorted_descriptions += new_descriptions
+                sorted_descriptions.sort()
+            for position in range(self._positions_count, len(self._descriptions)):
+                positions[self._descriptions[position]].append(position)
+            self._positions_count = len(self._descriptions)
+
+    def query(self, timestamps=False):
+        # LedgerQuery over this ledger, created once and kept up to date; timestamps=True adds the index for
+        # LedgerQuery.sum_between
+        with _locked(self):
+            if self._query is None or (timestamps and self._query._amount_prefix is None):
+                self._query = LedgerQuery(self, timestamps)
+            return self._query
+
+    def _matching_positions(self, description_prefix, min_amount, max_amount):
+        # ledger positions (in ledger order) of the entries matching the filters of ledger_lines
+        if description_prefix is None:
+            positions = range(len(self._amounts))
+        elif self._description_positions is not None:
+            self.index_descriptions()
+            sorted_descriptions = self._sorted_descriptions
+            start = bisect_left(sorted_descriptions, (description_prefix,))
+            matching = []
+            for description, description_index in islice(sorted_descriptions, start, None):
+                if not description.startswith(description_prefix):
+                    break
+                matching.append(self._description_positions[description_index])
+            positions = heapq.merge(*matching)
+        else:
+            matching = {description_index for description_index, description in enumerate(self._description_table)
+                        if description.startswith(description_prefix)}
+            descriptions = self._descriptions
+            positions = (position for position in range(len(descriptions)) if descriptions[position] in matching)
+
+        if min_amount is None and max_amount is None:
+            return positions
+        low = -2 ** 63 if min_amount is None else _parse_cents(min_amount)
+        high = 2 ** 63 - 1 if max_amount is None else _parse_cents(max_amount)
+        amounts = self._amounts
+        return (position for position in positions if low <= amounts[position] <= high)
+
+    def deposit(self, amount, description="", timestamp=None):
         # print(f"++ Depositing {amount} to {self.category}")
-        try:
-            amount = float(amount)
-        except ValueError:
-            raise InvalidAmountError("ERROR - amount must be a number")
-        if amount < 0:
-            raise InvalidAmountError("ERROR - amount must be a positive number")
-
-        self.ledger.append({
-            "amount": amount,
-            "description": str(description)})
-
-    def withdraw(self, amount, description=""):
-        try:
-            amount = float(amount)
-        except ValueError:
-            raise InvalidAmountError("ERROR - amount must be an number")
-        if amount < 0:
-            raise InvalidAmountError("ERROR - amount must be a positive number")
-
-        if self.check_funds(amount):
-            self.ledger.append({
-                "amount": amount * (-1),
-                "description": str(description)})
-            self.category_spending_sum = math.fsum([amount])
+        self._append(_positive_cents(amount), description, timestamp)
+
+    def withdraw(self, amount, description="", timestamp=None):
+        cents = _positive_cents(amount)
+        if cents <= self._balance_cents:
+            self._append(-cents, description, timestamp)
             return True
-        print(f"xx Withdrawing {amount:.2f} from {self.category} not possible - "
+        print(f"xx Withdrawing {cents / 100:.2f} from {self.category} not possible - "
               f"not enough funds: {self.get_balance():.2f}")
         return False
 
     def get_balance(self):
-        balance = []
-        index_length = len(self.ledger)
-        for i in range(index_length):
-            balance.append(self.ledger[i]['amount'])
-        updated_balance = math.fsum(balance)
-        # print(f"!! Getting balance for {self.category}")
-        return updated_balance
-
-    def transfer(self, amount, transfer_to_object):
+        return self._balance_cents / 100
+
+    def _check_timestamp(self, timestamp):
+        # an explicit timestamp has to be finite and can't be older than the last entry, the timestamps stay sorted
+        # (a nan would compare neither older nor newer and break the bisect of spending_since)
+        if not math.isfinite(timestamp):
+            raise InvalidTimestampError(f"ERROR - timestamp must be finite, got {timestamp!r}")
+        if self._timestamps and timestamp < self._timestamps[-1]:
+            raise InvalidTimestampError(f"ERROR - timestamp {timestamp} is older than the last entry "
+                                        f"of {self.category} ({self._timestamps[-1]})")
+
+    def _append(self, cents, description, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+            if self._timestamps and timestamp < self._timestamps[-1]:
+                # the clock went backwards, keep the timestamps sorted
+                timestamp = self._timestamps[-1]
+        else:
+            self._check_timestamp(timestamp)
+        description = str(description)
+        # the amount goes first: an amount which doesn't fit in 64 bits raises before anything else is changed
+        self._amounts.append(cents)
+        description_index = self._description_indexes.get(description)
+        if description_index is None:
+            description_index = len(self._description_table)
+            self._description_indexes[description] = description_index
+            self._description_table.append(description)
+        self._descriptions.append(description_index)
+        self._balance_cents += cents
+        if cents < 0:
+            self._spending_cents -= cents
+        self._timestamps.append(timestamp)
+        self._spending_prefix.append(self._spending_cents)
+        if self._journal is not None:
+            self._journal._record([(self.category, cents, description, timestamp)])
+
+    def ledger_amounts(self, as_numpy=False):
+        # copy of all the amounts in cents, as an int64 numpy array for vectorized work if requested
+        if as_numpy:
+            if np is None:
+                raise ImportError("ERROR - numpy is required for as_numpy=True")
+            return np.array(self._amounts, dtype=np.int64)
+        return array("q", self._amounts)
+
+    def sum_ledger(self, min_amount=None, max_amount=None):
+        # sum of the ledger amounts between min_amount and max_amount (both inclusive, None means no limit)
+        if min_amount is None and max_amount is None:
+            return self._balance_cents / 100
+        low = -2 ** 63 if min_amount is None else _parse_cents(min_amount)
+        high = 2 ** 63 - 1 if max_amount is None else _parse_cents(max_amount)
+        if np is not None:
+            amounts = np.frombuffer(self._amounts, dtype=np.int64) if self._amounts else np.zeros(0, np.int64)
+            return int(amounts[(amounts >= low) & (amounts <= high)].sum()) / 100
+        return sum(cents for cents in self._amounts if low <= cents <= high) / 100
+
+    def import_transactions(self, path, chunk_size=100_000):
+        # streams a .csv (header: amount,description[,timestamp]) or .jsonl file of transactions into the ledger;
+        # negative amounts are withdrawals. Every chunk is validated as a whole and then appended in one pass;
+        # an invalid row raises InvalidAmountError/InvalidTimestampError and leaves its chunk out of the ledger
+        # (the chunks before it stay). Returns the number of imported transactions.
+        imported = 0
+        with open(path, newline="") as file:
+            if str(path).endswith(".csv"):
+                rows = csv.DictReader(file)
+            else:
+                rows = (json.loads(line) for line in file if line.strip())
+            line_number = 1
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    return imported
+                self._append_chunk(chunk, line_number)
+                line_number += len(chunk)
+                imported += len(chunk)
+
+    def _append_chunk(self, chunk, first_line):
+        amounts = array("q")
+        descriptions = array("I")
+        timestamps = array("d")
+        spending_prefix = array("q")
+        balance_cents = self._balance_cents
+        spending_cents = self._spending_cents
+        last_timestamp = self._timestamps[-1] if self._timestamps else -math.inf
+        now = time.time()
+        new_descriptions = {}
+        for line, row in enumerate(chunk, first_line):
+            try:
+                cents = _parse_cents(row["amount"])
+            except (KeyError, InvalidAmountError):
+                raise InvalidAmountError(f"ERROR - line {line}: amount must be a number, got {row.get('amount')!r}")
+            balance_cents += cents
+            if cents < 0:
+                if balance_cents < 0:
+                    raise InvalidAmountError(f"ERROR - line {line}: not enough funds for {cents / 100:.2f}")
+                spending_cents -= cents
+            timestamp = row.get("timestamp")
+            try:
+                # a row without a timestamp is posted now, or at the last timestamp like in _append
+                timestamp = max(now, last_timestamp) if timestamp in (None, "") else float(timestamp)
+            except (TypeError, ValueError):
+                raise InvalidTimestampError(f"ERROR - line {line}: timestamp must be a number, got {timestamp!r}")
+            if not math.isfinite(timestamp):
+                raise InvalidTimestampError(f"ERROR - line {line}: timestamp must be finite, got {timestamp!r}")
+            if timestamp < last_timestamp:
+                raise InvalidTimestampError(f"ERROR - line {line}: timestamp {timestamp} is older "
+                                            f"than {last_timestamp}")
+            last_timestamp = timestamp
+
+            description = str(row.get("description") or "")
+            description_index = self._description_indexes.get(description, new_descriptions.get(description))
+            if description_index is None:
+                description_index = len(self._description_table) + len(new_descriptions)
+                new_descriptions[description] = description_index
+            amounts.append(cents)
+            descriptions.append(description_index)
+            timestamps.append(timestamp)
+            spending_prefix.append(spending_cents)
+
+        # the whole chunk is valid, append it
+        self._description_indexes.update(new_descriptions)
+        self._description_table.extend(new_descriptions)
+        self._amounts.extend(amounts)
+        self._descriptions.extend(descriptions)
+        self._timestamps.extend(timestamps)
+        self._spending_prefix.extend(spending_prefix)
+        self._balance_cents = balance_cents
+        self._spending_cents = spending_cents
+        if self._journal is not None:
+            table = self._description_table
+            self._journal._record([(self.category, cents, table[index], timestamp)
+                                   for cents, index, timestamp in zip(amounts, descriptions, timestamps)])
+
+    def export_transactions(self, path):
+        # writes the ledger as .csv or .jsonl in the format read by import_transactions
+        table = self._description_table
+        rows = zip(self._amounts, self._descriptions, self._timestamps)
+        with open(path, "w", newline="") as file:
+            if str(path).endswith(".csv"):
+                writer = csv.writer(file)
+                writer.writerow(["amount", "description", "timestamp"])
+                writer.writerows((f"{cents / 100:.2f}", table[index], repr(timestamp))
+                                 for cents, index, timestamp in rows)
+            else:
+                file.writelines(json.dumps({"amount": cents / 100, "description": table[index],
+                                            "timestamp": timestamp}) + "\n"
+                                for cents, index, timestamp in rows)
+
+    def save_snapshot(self, path):
+        # binary snapshot: header, category name, then the columns as little-endian arrays, every section aligned
+        # to 8 bytes so the columns can also be memory-mapped directly (e.g. with numpy.memmap)
+        name = self.category.encode()
+        table = [description.encode() for description in self._description_table]
+        offsets = array("q", [0])
+        for description in table:
+            offsets.append(offsets[-1] + len(description))
+        with open(path, "wb") as file:
+            file.write(_SNAPSHOT_MAGIC)
+            file.write(_SNAPSHOT_HEADER.pack(len(name), len(self._amounts), len(table), offsets[-1],
+                                             self._balance_cents, self._spending_cents))
+            file.write(_padded(name))
+            for column in (self._amounts, self._timestamps, self._spending_prefix, self._descriptions, offsets):
+                file.write(_padded(_little_endian(column).tobytes()))
+            file.write(b"".join(table))
+            file.flush()
+            os.fsync(file.fileno())
+
+    @classmethod
+    def load_snapshot(cls, path):
+        # loads a snapshot written by save_snapshot; the file is memory-mapped and every column is copied into its
+        # array as a block of bytes, so no transaction is replayed
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size < len(_SNAPSHOT_MAGIC) + _SNAPSHOT_HEADER.size:
+                raise InvalidCategoryError(f"ERROR - {path} is not a budget snapshot or is truncated")
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        with data:
+            if data[:len(_SNAPSHOT_MAGIC)] != _SNAPSHOT_MAGIC:
+                raise InvalidCategoryError(f"ERROR - {path} is not a budget snapshot")
+            position = len(_SNAPSHOT_MAGIC)
+            name_length, entries, num_descriptions, table_length, balance_cents, spending_cents = \
+                _SNAPSHOT_HEADER.unpack_from(data, position)
+            position += _SNAPSHOT_HEADER.size
+            # the sizes of the sections follow from the header, a shorter file was cut off while being written
+            expected_size = (position + _padded_length(name_length) + 3 * _padded_length(8 * entries) +
+                             _padded_length(4 * entries) + _padded_length(8 * (num_descriptions + 1)) + table_length)
+            if len(data) < expected_size:
+                raise InvalidCategoryError(f"ERROR - {path} is truncated: {len(data)} of {expected_size} bytes")
+            category = cls(bytes(data[position:position + name_length]).decode())
+            position += _padded_length(name_length)
+
+            columns = []
+            for typecode, length in (("q", entries), ("d", entries), ("q", entries), ("I", entries),
+                                     ("q", num_descriptions + 1)):
+                column = array(typecode)
+                column.frombytes(data[position:position + length * column.itemsize])
+                columns.append(_little_endian(column))
+                position += _padded_length(length * column.itemsize)
+            table = bytes(data[position:position + table_length])
+
+        amounts, timestamps, spending_prefix, descriptions, offsets = columns
+        if offsets[-1] != table_length:
+            raise InvalidCategoryError(f"ERROR - {path} is corrupted: the description table doesn't match its offsets")
+        category._amounts = amounts
+        category._timestamps = timestamps
+        category._spending_prefix = spending_prefix
+        category._descriptions = descriptions
+        category._description_table = [table[offsets[i]:offsets[i + 1]].decode() for i in range(num_descriptions)]
+        category._description_indexes = {description: i for i, description in enumerate(category._description_table)}
+        category._balance_cents = balance_cents
+        category._spending_cents = spending_cents
+        return category
+
+    def transfer(self, amount, transfer_to_object, timestamp=None):
         if not isinstance(transfer_to_object, Category):
             raise InvalidCategoryError(f"ERROR - Cannot transfer {amount} funds from {self.category} "
                                        f"to {transfer_to_object, type(transfer_to_object)}. "
                                        f"The Object is on an instance of the class")
-        if not self.check_funds(amount):
+        # the amount is parsed and checked once, both ledger entries are written from the same cents
+        cents = _positive_cents(amount)
+        if cents > self._balance_cents:
             # print("xx Transfer not possible - not enough funds")
             return False
         else:
-            self.withdraw(amount, "Transfer to " + transfer_to_object.category)
-            # print(f"~~ Transferring {amount} from {self.category} to {transfer_to_object.category}")
-            # print(f'||Transfer to {amount} from {self.category}')
-            transfer_to_object.deposit(amount, "Transfer from " + self.category)
+            # both timestamps are checked before the first entry is written, so a transfer is never half done
+            if timestamp is not None:
+                self._check_timestamp(timestamp)
+                transfer_to_object._check_timestamp(timestamp)
+            with _journal_transaction(self, transfer_to_object):
+                self._append(-cents, "Transfer to " + transfer_to_object.category, timestamp)
+                # print(f"~~ Transferring {amount} from {self.category} to {transfer_to_object.category}")
+                # print(f'||Transfer to {amount} from {self.category}')
+                transfer_to_object._append(cents, "Transfer from " + self.category, timestamp)
             # print("  Transfer complete")
             return True
 
     def check_funds(self, amount):
-        try:
-            amount = float(amount)
-        except ValueError:
-            raise InvalidAmountError("ERROR - amount must be a number")
-        if amount < 0:
-            raise InvalidAmountError("ERROR - amount must be a positive number")
-
-        if amount <= self.get_balance():
+        if _positive_cents(amount) <= self._balance_cents:
             return True
         else:
             return False
 
 
+class ThreadSafeCategory(Category):
+    # Category which can be used from many threads: every category has its own lock, so transactions on different
+    # categories run concurrently, and checking the funds and writing the ledger happen under the same lock, so
+    # concurrent withdrawals or transfers can't overdraw it. Operations on two or more categories take the locks
+    # in the order the categories were created, which rules out deadlocks between opposite transfers.
+    _lock_orders = itertools.count()
+
+    def __init__(self, category=""):
+        super().__init__(category)
+        self._lock = threading.RLock()
+        self._lock_order = next(ThreadSafeCategory._lock_orders)
+
+    def __str__(self):
+        with self._lock:
+            return super().__str__()
+
+    def deposit(self, amount, description="", timestamp=None):
+        with self._lock:
+            return super().deposit(amount, description, timestamp)
+
+    def withdraw(self, amount, description="", timestamp=None):
+        with self._lock:
+            return super().withdraw(amount, description, timestamp)
+
+    def transfer(self, amount, transfer_to_object, timestamp=None):
+        with _locked(self, transfer_to_object):
+            return super().transfer(amount, transfer_to_object, timestamp)
+
+    def check_funds(self, amount):
+        with self._lock:
+            return super().check_funds(amount)
+
+    def import_transactions(self, path, chunk_size=100_000):
+        with self._lock:
+            return super().import_transactions(path, chunk_size)
+
+    def save_snapshot(self, path):
+        with self._lock:
+            return super().save_snapshot(path)
+
+    # asyncio interface: the blocking methods run in the default executor, so a coroutine waiting for a busy
+    # category doesn't block the event loop and only waits for that category's lock
+    async def deposit_async(self, amount, description="", timestamp=None):
+        return await asyncio.to_thread(self.deposit, amount, description, timestamp)
+
+    async def withdraw_async(self, amount, description="", timestamp=None):
+        return await asyncio.to_thread(self.withdraw, amount, description, timestamp)
+
+    async def transfer_async(self, amount, transfer_to_object, timestamp=None):
+        return await asyncio.to_thread(self.transfer, amount, transfer_to_object, timestamp)
+
+
+@contextmanager
+def _locked(*categories):
+    # takes the locks of all the thread-safe categories in their creation order (each one once)
+    thread_safe = {id(category): category for category in categories if isinstance(category, ThreadSafeCategory)}
+    locks = [category._lock for category in sorted(thread_safe.values(), key=lambda category: category._lock_order)]
+    for lock in locks:
+        lock.acquire()
+    try:
+        yield
+    finally:
+        for lock in reversed(locks):
+            lock.release()
+
+
+class LedgerJournal:
+    # append-only write-ahead log of the ledger entries of the attached categories, with periodic snapshots.
+    #
+    # Every deposit, withdrawal and import chunk is one line of JSON, and so is a whole transfer (or transfer
+    # batch), so a transfer is either replayed completely or not at all. The lines are buffered and written with
+    # one write and one fsync per group (group commit): when group_size lines are waiting, flush_interval
+    # seconds after the oldest waiting line was recorded (by a timer thread if no later entry does it), or on
+    # commit()/close(). Entries which weren't written yet are lost on a crash, so call commit() where durability
+    # is needed.
+    #
+    # checkpoint() writes a snapshot of every category and starts a new, empty log, which bounds the replay time;
+    # commit() runs it once checkpoint_every lines were written since the last one. The directory holds a manifest
+    # with the current generation, the snapshots of that generation and its log, and the manifest is replaced
+    # atomically, so a crash at any point leaves either the old or the new generation complete. A journal opened
+    # on an existing directory recovers its categories first, like recover().
+
+    def __init__(self, directory, group_size=1000, flush_interval=0.05, checkpoint_every=1_000_000,
+                 category_class=Category):
+        self.directory = str(directory)
+        self.group_size = group_size
+        self.flush_interval = flush_interval
+        self.checkpoint_every = checkpoint_every
+        self.categories = {}
+        # an existing journal is continued in its current generation, with its categories recovered and attached,
+        # so a checkpoint never drops a category the manifest or the log still holds
+        self._generation, categories = self._recover_categories(self.directory, category_class)
+        self._lines_since_checkpoint = 0
+        self._buffer = []
+        self._oldest_buffered = None
+        self._flush_timer = None
+        self._lock = threading.RLock()
+        self._transactions = threading.local()
+        os.makedirs(self.directory, exist_ok=True)
+        self._log = open(self._log_path(self._generation), "ab")
+        for category in categories.values():
+            self.attach(category)
+
+    def attach(self, category):
+        # starts journaling the entries of the category; its current ledger is saved at the next checkpoint
+        with self._lock:
+            if self.categories.get(category.category, category) is not category:
+                raise InvalidCategoryError(f"ERROR - a category named {category.category} is already journaled")
+            self.categories[category.category] = category
+            category._journal = self
+        return category
+
+    def commit(self):
+        # writes and fsyncs all the buffered lines, and checkpoints when checkpoint_every lines were committed
+        self._write()
+        if self._lines_since_checkpoint >= self.checkpoint_every:
+            self.checkpoint()
+
+    def checkpoint(self):
+        # the category locks are taken before the journal lock, like in deposit/withdraw
+        with _locked(*self.categories.values()), self._lock:
+            self._write()
+            generation = self._generation + 1
+            snapshots = {}
+            for number, (name, category) in enumerate(self.categories.items()):
+                snapshots[name] = f"snapshot-{generation}-{number}.bin"
+                category.save_snapshot(os.path.join(self.directory, snapshots[name]))
+            new_log = open(self._log_path(generation), "wb")
+            os.fsync(new_log.fileno())
+            # the snapshots (fsynced by save_snapshot) and the new log have to be on disk, directory entries
+            # included, before the manifest points at them, and the new manifest before the old files are removed
+            _fsync_directory(self.directory)
+            manifest_path = os.path.join(self.directory, "manifest.json")
+            with open(manifest_path + ".tmp", "w") as manifest:
+                json.dump({"generation": generation, "snapshots": snapshots}, manifest)
+                manifest.flush()
+                os.fsync(manifest.fileno())
+            os.replace(manifest_path + ".tmp", manifest_path)
+            _fsync_directory(self.directory)
+
+            self._log.close()
+            self._log = new_log
+            self._generation = generation
+            self._lines_since_checkpoint = 0
+            for file_name in os.listdir(self.directory):
+                if file_name.startswith(("snapshot-", "journal-")) and \
+                        not file_name.startswith((f"snapshot-{generation}-", f"journal-{generation}.")):
+                    os.remove(os.path.join(self.directory, file_name))
+
+    def close(self):
+        with self._lock:
+            self._write()
+            self._log.close()
+            for category in self.categories.values():
+                category._journal = None
+
+    @classmethod
+    def recover(cls, directory, category_class=Category, **options):
+        # rebuilds the categories from the latest snapshots and the log written after them, and returns the
+        # journal with all of them attached (in journal.categories). A torn last line, left by a crash in the
+        # middle of a write, is dropped.
+        return cls(directory, category_class=category_class, **options)
+
+    @staticmethod
+    def _recover_categories(directory, category_class):
+        # the generation of the journal in the directory and its categories rebuilt from the snapshots and the log
+        generation, snapshots = _read_journal_manifest(directory)
+
+        categories = {name: category_class.load_snapshot(os.path.join(directory, file_name))
+                      for name, file_name in snapshots.items()}
+        log_path = os.path.join(directory, f"journal-{generation}.log")
+        if os.path.exists(log_path):
+            with open(log_path, "rb+") as log:
+                valid_length = 0
+                for line in log:
+                    try:
+                        entries = json.loads(line)
+                    except ValueError:
+                        break
+                    if not line.endswith(b"\n"):
+                        break
+                    for name, cents, description, timestamp in entries:
+                        if name not in categories:
+                            categories[name] = category_class(name)
+                        categories[name]._append(cents, description, timestamp)
+                    valid_length += len(line)
+                log.truncate(valid_length)
+        return generation, categories
+
+    def _write(self):
+        with self._lock:
+            if not self._buffer:
+                return
+            self._log.write(b"".join(self._buffer))
+            self._log.flush()
+            os.fsync(self._log.fileno())
+            self._lines_since_checkpoint += len(self._buffer)
+            self._buffer = []
+            self._oldest_buffered = None
+            # the group is written, its timer isn't needed any more
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+
+    def _log_path(self, generation):
+        return os.path.join(self.directory, f"journal-{generation}.log")
+
+    def _record(self, entries):
+        transactions = self._transactions
+        if getattr(transactions, "depth", 0):
+            transactions.entries.extend(entries)
+            return
+        line = (json.dumps(entries, separators=(",", ":")) + "\n").encode()
+        with self._lock:
+            self._buffer.append(line)
+            if self._oldest_buffered is None:
+                self._oldest_buffered = time.monotonic()
+                # a timer writes the group when no later entry comes in time to do it
+                self._flush_timer = threading.Timer(self.flush_interval, self._write)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+            # the automatic checkpoints only run in commit(), which isn't called with a category lock held
+            if len(self._buffer) >= self.group_size or \
+                    time.monotonic() - self._oldest_buffered >= self.flush_interval:
+                self._write()
+
+    def _begin(self):
+        transactions = self._transactions
+        if not getattr(transactions, "depth", 0):
+            transactions.depth = 0
+            transactions.entries = []
+        transactions.depth += 1
+
+    def _end(self):
+        transactions = self._transactions
+        transactions.depth -= 1
+        if transactions.depth == 0 and transactions.entries:
+            entries, transactions.entries = transactions.entries, []
+            self._record(entries)
+
+
+def _read_journal_manifest(directory):
+    # returns the generation of the journal in the directory and its snapshot file of every category name
+    manifest_path = os.path.join(directory, "manifest.json")
+    if not os.path.exists(manifest_path):
+        return 0, {}
+    with open(manifest_path) as manifest:
+        manifest = json.load(manifest)
+    return manifest["generation"], manifest["snapshots"]
+
+
+@contextmanager
+def _journal_transaction(*categories):
+    # the entries written inside are recorded as one line of every journal involved
+    journals = list({id(category._journal): category._journal
+                     for category in categories if category._journal is not None}.values())
+    for journal in journals:
+        journal._begin()
+    try:
+        yield
+    finally:
+        for journal in journals:
+            journal._end()
+
+
+def transfer_batch(transfers, timestamp=None):
+    # applies a list of (source, destination, amount) transfers all or nothing: every transfer is checked once
+    # against the running balances (in order, so a transfer can spend money received earlier in the batch) and
+    # only when all of them have enough funds are they written to the ledgers. Returns the status of every
+    # transfer - if any of them is False, no ledger was changed. A timestamp older than the last entry of any of
+    # the categories raises InvalidTimestampError, also without changing a ledger. Thread-safe categories are
+    # locked while the batch is checked and written.
+    checked = []
+    balances = {}
+    for source, destination, amount in transfers:
+        for category in (source, destination):
+            if not isinstance(category, Category):
+                raise InvalidCategoryError(f"ERROR - Cannot transfer {amount} funds between {source} and "
+                                           f"{destination}. {category, type(category)} is not a Category")
+        checked.append((source, destination, _positive_cents(amount)))
+
+    categories = [category for source, destination, _ in checked for category in (source, destination)]
+    with _locked(*categories):
+        statuses = []
+        for source, destination, cents in checked:
+            if cents <= balances.setdefault(id(source), source._balance_cents):
+                balances[id(source)] -= cents
+                balances[id(destination)] = balances.setdefault(id(destination), destination._balance_cents) + cents
+                statuses.append(True)
+            else:
+                statuses.append(False)
+
+        if all(statuses):
+            # an explicit timestamp is checked against every category before anything is written
+            if timestamp is not None:
+                for category in categories:
+                    category._check_timestamp(timestamp)
+            with _journal_transaction(*categories):
+                for source, destination, cents in checked:
+                    source._append(-cents, "Transfer to " + destination.category, timestamp)
+                    destination._append(cents, "Transfer from " + source.category, timestamp)
+    return statuses
+
+
+# below this many cents (about 22.5 trillion) round(float(amount) * 100) is the exact number of cents of any amount
+# with at most two decimals: the float parsing and the multiplication each round by at most half an ulp, which
+# stays below half a cent only while the cents fit in 51 bits (from 2 ** 51 on, an ulp of the product is a cent)
+_EXACT_FLOAT_CENTS = 2 ** 51
+
+
+def _parse_cents(amount, positive=False):
+    # an amount in integer cents, parsed once per operation. float() is the fastest parser of decimal strings and
+    # exact in the range above; ints and decimal strings beyond it are converted exactly instead. With positive=True
+    # a negative amount is rejected before rounding, so e.g. -0.001 doesn't pass as 0 cents.
+    try:
+        value = float(amount)
+        cents = round(value * 100)
+    except (TypeError, ValueError, OverflowError):
+        raise InvalidAmountError(f"ERROR - amount must be a number, got {amount!r}")
+    if positive and value < 0:
+        raise InvalidAmountError("ERROR - amount must be a positive number")
+    if -_EXACT_FLOAT_CENTS < cents < _EXACT_FLOAT_CENTS:
+        return cents
+    if isinstance(amount, int):
+        cents = amount * 100
+    elif isinstance(amount, str):
+        cents = int((Decimal(amount.strip()) * 100).to_integral_value())
+    # the ledger stores the cents as 64-bit integers
+    if not -2 ** 63 < cents < 2 ** 63:
+        raise InvalidAmountError(f"ERROR - amount is too large, got {amount!r}")
+    return cents
+
+
+def _positive_cents(amount):
+    # validation of the amount of a deposit, withdrawal or transfer
+    return _parse_cents(amount, positive=True)
+
+
+_SNAPSHOT_MAGIC = b"BUDGET\x00\x01"
+# name length, number of entries, number of descriptions, description table length, balance, spending
+_SNAPSHOT_HEADER = struct.Struct("<QQQQqq")
+
+
+def _fsync_directory(directory):
+    # makes the created, renamed and removed files of a directory durable (not possible on Windows)
+    if os.name == "nt":
+        return
+    descriptor = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+def _padded_length(length):
+    return (length + 7) // 8 * 8
+
+
+def _padded(data):
+    return data + b"\x00" * (_padded_length(len(data)) - len(data))
+
+
+def _little_endian(column):
+    # snapshots are little-endian, swap the bytes on big-endian machines (in place on a copy for writing)
+    if sys.byteorder == "little":
+        return column
+    column = array(column.typecode, column)
+    column.byteswap()
+    return column
+
+
 ################################################
-def create_spend_chart(*ledger):
-    # total spending sum and per category
-    spending_categories = [{"category": i.category, "spending": i.category_spending_sum} for i in ledger[0]]
+class SpendingAggregator:
+    # daily, weekly and monthly spending rollups of many categories, kept in their own currencies and converted
+    # when they are read.
+    #
+    # Every attached category is tagged with its currency and gets, for every period, a dictionary of bucket number:
+    # spending in cents (days since 1970-01-01 in UTC, weeks starting on Monday, months since January 1970). The
+    # buckets are updated with the entries appended since the last read, so the reads never scan a whole ledger.
+    # rates maps every currency to its value in the base currency; a rate can be changed at any time, and the
+    # stored rollups don't depend on it.
+
+    PERIODS = ("day", "week", "month")
+
+    def __init__(self, currency="USD", rates=None):
+        self.currency = currency
+        self.rates = {currency: 1.0}
+        self.rates.update(rates or {})
+        self._categories = {}
+        self._month_of_day = {}
+
+    def attach(self, category, currency=None):
+        # starts aggregating the spending of the category, in the base currency if no currency is given
+        currency = currency or self.currency
+        if self._categories.get(category.category, (category,))[0] is not category:
+            raise InvalidCategoryError(f"ERROR - a category named {category.category} is already aggregated")
+        self._categories[category.category] = (category, currency, {period: {} for period in self.PERIODS}, [0])
+        return category
+
+    def set_rate(self, currency, rate):
+        if rate <= 0:
+            raise InvalidCurrencyError(f"ERROR - the rate of {currency} must be positive")
+        self.rates[currency] = float(rate)
+
+    def spending(self, period="month", since=None, until=None, currency=None, categories=None):
+        # {bucket start date: {category name: spending}} of the buckets from the one containing since to the one
+        # containing until (timestamps, both included, None means no limit), converted to currency (the base
+        # currency by default); categories limits the result to the given category names
+        buckets = self._bucket_range(period, since, until)
+        spending = {}
+        for name, rollups, rate in self._rollups(period, currency, categories):
+            for bucket, cents in rollups.items():
+                if buckets[0] <= bucket <= buckets[1]:
+                    spending.setdefault(bucket, {})[name] = cents * rate / 100
+        return {self._bucket_start(period, bucket): spending[bucket] for bucket in sorted(spending)}
+
+    def totals(self, period="month", since=None, until=None, currency=None, categories=None):
+        # {category name: spending} over the same buckets as spending
+        buckets = self._bucket_range(period, since, until)
+        return {name: sum(cents for bucket, cents in rollups.items() if buckets[0] <= bucket <= buckets[1]) * rate / 100
+                for name, rollups, rate in self._rollups(period, currency, categories)}
+
+    def spend_chart(self, period="month", since=None, until=None, currency=None, categories=None):
+        # create_spend_chart of the spending in the buckets selected like in spending
+        totals = self.totals(period, since, until, currency, categories)
+        return _render_spend_chart([{"category": name, "spending": spending} for name, spending in totals.items()])
+
+    def _rollups(self, period, currency, categories):
+        # (name, buckets of the period, conversion rate of the currency of the category to currency) of every
+        # selected category, after adding the entries appended since the last read
+        if period not in self.PERIODS:
+            raise ValueError(f"ERROR - period must be one of {', '.join(self.PERIODS)}")
+        currency = currency or self.currency
+        if currency not in self.rates:
+            raise InvalidCurrencyError(f"ERROR - no rate for {currency}")
+        names = self._categories if categories is None else categories
+        for name in names:
+            category, category_currency, rollups, counts = self._categories[name]
+            if category_currency not in self.rates:
+                raise InvalidCurrencyError(f"ERROR - no rate for {category_currency}")
+            # the buckets are copied under the lock of a thread-safe category, another thread may be posting to it
+            with _locked(category):
+                self._update(category, rollups, counts)
+                buckets = dict(rollups[period])
+            yield name, buckets, self.rates[category_currency] / self.rates[currency]
+
+    def _update(self, category, rollups, counts):
+        with _locked(category):
+            days, weeks, months = rollups["day"], rollups["week"], rollups["month"]
+            amounts, timestamps = category._amounts, category._timestamps
+            for position in range(counts[0], len(amounts)):
+                cents = amounts[position]
+                if cents < 0:
+                    day = int(timestamps[position] // 86400)
+                    days[day] = days.get(day, 0) - cents
+                    week = (day + 3) // 7
+                    weeks[week] = weeks.get(week, 0) - cents
+                    month = self._month(day)
+                    months[month] = months.get(month, 0) - cents
+            counts[0] = len(amounts)
+
+    def _month(self, day):
+        month = self._month_of_day.get(day)
+        if month is None:
+            day_date = date(1970, 1, 1) + timedelta(days=day)
+            month = self._month_of_day[day] = (day_date.year - 1970) * 12 + day_date.month - 1
+        return month
+
+    def _bucket(self, period, timestamp):
+        day = int(timestamp // 86400)
+        return {"day": day, "week": (day + 3) // 7, "month": self._month(day)}[period]
+
+    def _bucket_range(self, period, since, until):
+        return (-math.inf if since is None else self._bucket(period, since),
+                math.inf if until is None else self._bucket(period, until))
+
+    @staticmethod
+    def _bucket_start(period, bucket):
+        if period == "month":
+            return date(1970 + bucket // 12, bucket % 12 + 1, 1)
+        return date(1970, 1, 1) + timedelta(days=bucket if period == "day" else bucket * 7 - 3)
+
+
+# percentage labels of the rows of the spend chart, the rows below them are indented by as many spaces
+_CHART_LABELS = [f"{i:3d}|" for i in range(100, -1, -10)]
+
+
+def create_spend_chart(*ledger, since=None):
+    # total spending sum and per category (only the spending posted at or after the since timestamp if given)
+    if since is None:
+        spending_categories = [{"category": i.category, "spending": i.category_spending_sum} for i in ledger[0]]
+    else:
+        spending_categories = [{"category": i.category, "spending": i.spending_since(since)} for i in ledger[0]]
+    return _render_spend_chart(spending_categories)
+
+
+def _render_spend_chart(spending_categories):
+    # the chart of the spending of a list of {"category", "spending"} dicts, shared by the aggregator charts
     total_withdraw_sum = math.fsum([category["spending"] for category in spending_categories])
 
     # calculating percentages
@@ -127,43 +1206,18 @@ def create_spend_chart(*ledger):
     max_category = max(len(category['category']) for category in spending_categories)
     max_chart_height = 10 + max_category + 2
 
-    # generating percentage line
-    line_1 = [f"{i:3d}|" for i in range(100, -1, -10)]
-    line_1 += [" " * 4] * (max_chart_height - len(line_1))
-
-    # generating inbetween lines
-    line_bonus = [' ' for _ in range(11)] + ['-'] + [' ' for _ in range(max_chart_height - 12)]
-
-    # generating a new line list for the end
-    line_new_line = [f"\n" for _ in range(max_chart_height)]
-
-    # generating bars for *categories
-    generated_lines = {"line_" + str(i + 2): [] for i in range(len(percentages_list))}
-    for i in range(len(generated_lines)):
-        key = "line_" + str(i + 2)
-        generated_lines[key] += [f" " for _ in range(100, percentages_list[i], -10)]
-        generated_lines[key] += [f"o" for _ in range(percentages_list[i] + 1, -1, -10)]
-        generated_lines[key] += [f"-"]
-        generated_lines[key] += [f"{j}" for j in f"{spending_categories[i]['category']}"]
-        generated_lines[key] += [f" " for _ in range(max_chart_height - len(generated_lines[key]))]
-    # print(generated_lines)
-
-    # creating matrix of list to be transposed
-    line_list = [line_1]
-    for i in range(len(percentages_list)):
-        line_list.append(line_bonus)
-        line_list.append(generated_lines["line_" + str(i + 2)])
-        line_list.append(line_bonus)
-    line_list.append(line_bonus)
-    line_list.append(line_new_line)
-
-    # transposing
-    matrix = zip(*line_list)
-    results = ""
-    results += "".join(f"{character}" for line in matrix for character in line)
+    # generating the column of every category: bar, separator and name, padded to the chart height
+    columns = [(" " * len(range(100, percentage, -10)) + "o" * len(range(percentage + 1, -1, -10)) + "-" +
+                category["category"]).ljust(max_chart_height)[:max_chart_height]
+               for percentage, category in zip(percentages_list, spending_categories)]
+
+    # every row is the percentage label followed by the characters of the columns in that row, one separator
+    # character (a dash in the row of the horizontal line) around each of them and one more at the end
+    rows = []
+    for row, characters in enumerate(zip(*columns)):
+        label = _CHART_LABELS[row] if row < len(_CHART_LABELS) else "    "
+        separator = "-" if row == len(_CHART_LABELS) else " "
+        rows.append(f"{label}{separator}{(separator * 2).join(characters)}{separator * 2}")
 
     # preparing the final string
-    final_text = f"Percentage spent by category\n" \
-                 f"{results}"
-    final_text = final_text[0:-1]
-    return f"{final_text}"
+    return "Percentage spent by category\n" + "\n".join(rows)
@@ -0,0 +1,596 @@
+import asyncio
+import math
+import random
+import sys
+import threading
+import time
+
+import pytest
+
+from datetime import date
+
+from budget import (Category, InvalidAmountError, InvalidCategoryError, InvalidCurrencyError, InvalidTimestampError,
+                    LedgerJournal, LedgerQuery, SpendingAggregator, ThreadSafeCategory, create_spend_chart,
+                    transfer_batch)
+
+
+def test_running_balance_matches_ledger():
+    generator = random.Random(1)
+    food = Category("Food")
+    for _ in range(2000):
+        if generator.random() < 0.6:
+            food.deposit(round(generator.uniform(0, 1e4), generator.choice([0, 1, 2])))
+        else:
+            food.withdraw(round(generator.uniform(0, 100), 2))
+        assert food.get_balance() == round(math.fsum(item["amount"] for item in food.ledger), 2)
+
+
+def test_running_balance_after_transfer():
+    food = Category("Food")
+    clothing = Category("Clothing")
+    food.deposit(0.1)
+    food.deposit(0.2)
+    food.transfer(0.3, clothing)
+    assert food.get_balance() == 0.0
+    assert clothing.get_balance() == 0.3
+
+
+def test_columnar_ledger_view():
+    food = Category("Food")
+    food.deposit(900, "deposit")
+    food.withdraw(45.67, "groceries")
+    food.withdraw(10, "groceries")
+    assert len(food.ledger) == 3
+    assert food.ledger[-1] == {"amount": -10, "description": "groceries"}
+    assert food.ledger[:2] == [{"amount": 900, "description": "deposit"},
+                               {"amount": -45.67, "description": "groceries"}]
+    assert food.ledger == list(food.ledger)
+    assert food._description_table == ["deposit", "groceries"]
+    assert list(food.ledger_amounts()) == [90000, -4567, -1000]
+
+
+def test_sum_ledger():
+    food = Category("Food")
+    for amount in (100, 20.5, 3.25):
+        food.deposit(amount)
+    food.withdraw(50)
+    assert food.sum_ledger() == 73.75
+    assert food.sum_ledger(min_amount=0) == 123.75
+    assert food.sum_ledger(min_amount=3.25, max_amount=20.5) == 23.75
+    assert food.sum_ledger(max_amount=0) == -50
+
+
+def test_spending_sum_counts_every_withdrawal_and_transfer():
+    food = Category("Food")
+    clothing = Category("Clothing")
+    food.deposit(1000, "initial deposit")
+    food.withdraw(10.15, "groceries")
+    food.withdraw(15.89, "restaurant")
+    food.transfer(50, clothing)
+    food.withdraw(5000, "not enough funds")
+    assert food.category_spending_sum == 76.04
+    assert clothing.category_spending_sum == 0
+
+
+def test_spending_since_timestamp():
+    food = Category("Food")
+    food.deposit(100, "deposit", timestamp=10)
+    food.withdraw(10, "a", timestamp=20)
+    food.withdraw(20, "b", timestamp=30)
+    food.deposit(5, "refund", timestamp=30)
+    food.withdraw(30, "c", timestamp=40)
+    assert food.spending_since(0) == 60
+    assert food.spending_since(30) == 50
+    assert food.spending_since(25, until=40) == 20
+    assert food.spending_since(41) == 0
+    with pytest.raises(InvalidTimestampError):
+        food.withdraw(1, "late", timestamp=35)
+
+
+def test_create_spend_chart_since():
+    food = Category("Food")
+    auto = Category("Auto")
+    food.deposit(100, timestamp=1)
+    auto.deposit(100, timestamp=1)
+    food.withdraw(90, timestamp=2)
+    food.withdraw(10, timestamp=5)
+    auto.withdraw(10, timestamp=5)
+    chart = create_spend_chart([food, auto], since=3)
+    assert "\n 50| o  o  " in chart
+    assert "\n 60|       " in chart
+
+
+def test_import_transactions_csv_in_chunks(tmp_path):
+    path = tmp_path / "food.csv"
+    path.write_text("amount,description,timestamp\n100,deposit,1\n-20.5,groceries,2\n-4.5,groceries,3\n50,,4\n")
+    food = Category("Food")
+    assert food.import_transactions(path, chunk_size=3) == 4
+    assert food.ledger[1] == {"amount": -20.5, "description": "groceries"}
+    assert food.ledger[3] == {"amount": 50, "description": ""}
+    assert food.get_balance() == 125
+    assert food.category_spending_sum == 25
+    assert food.spending_since(3) == 4.5
+
+
+def test_import_transactions_rejects_invalid_chunk(tmp_path):
+    path = tmp_path / "food.jsonl"
+    path.write_text('{"amount": 10, "description": "deposit"}\n{"amount": -5}\n'
+                    '{"amount": -50, "description": "too much"}\n')
+    food = Category("Food")
+    with pytest.raises(InvalidAmountError, match="line 3"):
+        food.import_transactions(path, chunk_size=2)
+    assert len(food.ledger) == 2
+    assert food.get_balance() == 5
+
+
+def test_import_transactions_timestamps(tmp_path):
+    future = time.time() + 1000
+    path = tmp_path / "food.csv"
+    path.write_text(f"amount,description,timestamp\n100,deposit,{future}\n-20,groceries,\n")
+    food = Category("Food")
+    # a row without a timestamp after a future one is posted at the future timestamp, like deposit() does
+    assert food.import_transactions(path) == 2
+    assert food._timestamps[-1] == future
+    path.write_text("amount,description,timestamp\n5,deposit,nan\n")
+    with pytest.raises(InvalidTimestampError, match="line 1"):
+        food.import_transactions(path)
+    for timestamp in (math.nan, math.inf):
+        with pytest.raises(InvalidTimestampError):
+            food.deposit(5, timestamp=timestamp)
+    assert food.get_balance() == 80
+
+
+def test_export_and_import_round_trip(tmp_path):
+    food = Category("Food")
+    food.deposit(900, "deposit", timestamp=1)
+    food.withdraw(45.67, "milk, cereal, eggs, bacon, bread", timestamp=2)
+    for name in ("food.csv", "food.jsonl"):
+        food.export_transactions(tmp_path / name)
+        imported = Category("Food")
+        imported.import_transactions(tmp_path / name)
+        assert imported.ledger == food.ledger
+        assert str(imported) == str(food)
+
+
+def test_binary_snapshot_round_trip(tmp_path):
+    food = Category("Food")
+    food.deposit(900, "deposit", timestamp=1)
+    food.withdraw(45.67, "groceries", timestamp=2)
+    food.withdraw(4.33, "groceries", timestamp=3)
+    food.save_snapshot(tmp_path / "food.snapshot")
+    loaded = Category.load_snapshot(tmp_path / "food.snapshot")
+    assert loaded.category == "Food"
+    assert loaded.ledger == food.ledger
+    assert loaded.get_balance() == 850
+    assert loaded.spending_since(3) == 4.33
+    loaded.withdraw(50, "groceries")
+    assert loaded._description_table == ["deposit", "groceries"]
+
+
+def test_truncated_snapshot_is_rejected(tmp_path):
+    food = Category("Food")
+    food.deposit(900, "deposit", timestamp=1)
+    food.save_snapshot(tmp_path / "food.snapshot")
+    data = (tmp_path / "food.snapshot").read_bytes()
+    for length in [0, 20, len(data) - 1]:
+        (tmp_path / "cut.snapshot").write_bytes(data[:length])
+        with pytest.raises(InvalidCategoryError):
+            Category.load_snapshot(tmp_path / "cut.snapshot")
+
+
+def test_transfer_batch_applies_all():
+    food, clothing, auto = Category("Food"), Category("Clothing"), Category("Auto")
+    food.deposit(100)
+    statuses = transfer_batch([(food, clothing, 60), (clothing, auto, 50.5), (food, auto, 40)])
+    assert statuses == [True, True, True]
+    assert (food.get_balance(), clothing.get_balance(), auto.get_balance()) == (0, 9.5, 90.5)
+    assert clothing.ledger[1] == {"amount": -50.5, "description": "Transfer to Auto"}
+    assert food.category_spending_sum == 100
+
+
+def test_transfer_batch_applies_nothing_on_failure():
+    food, clothing = Category("Food"), Category("Clothing")
+    food.deposit(100)
+    assert transfer_batch([(food, clothing, 60), (food, clothing, 50), (clothing, food, 10)]) == [True, False, True]
+    assert len(food.ledger) == 1 and len(clothing.ledger) == 0
+    with pytest.raises(InvalidCategoryError):
+        transfer_batch([(food, "Clothing", 10)])
+
+
+def test_thread_safe_category_can_not_be_overdrawn():
+    food, clothing = ThreadSafeCategory("Food"), ThreadSafeCategory("Clothing")
+    food.deposit(100)
+    results = []
+
+    def spend():
+        for _ in range(50):
+            results.append(food.transfer(1, clothing))
+
+    threads = [threading.Thread(target=spend) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results.count(True) == 100
+    assert food.get_balance() == 0
+    assert clothing.get_balance() == 100
+
+
+def test_thread_safe_opposite_transfers_do_not_deadlock():
+    food, clothing = ThreadSafeCategory("Food"), ThreadSafeCategory("Clothing")
+    food.deposit(1000)
+    clothing.deposit(1000)
+
+    def move(source, destination):
+        for _ in range(500):
+            source.transfer(1, destination)
+            transfer_batch([(destination, source, 1)])
+
+    threads = [threading.Thread(target=move, args=pair) for pair in [(food, clothing), (clothing, food)] * 2]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=30)
+    assert not any(thread.is_alive() for thread in threads)
+    assert food.get_balance() + clothing.get_balance() == 2000
+
+
+def test_thread_safe_category_async_interface():
+    food, clothing = ThreadSafeCategory("Food"), ThreadSafeCategory("Clothing")
+
+    async def post():
+        await asyncio.gather(*(food.deposit_async(1, "deposit") for _ in range(20)))
+        return await asyncio.gather(*(food.transfer_async(3, clothing) for _ in range(10)))
+
+    assert asyncio.run(post()).count(True) == 6
+    assert food.get_balance() == 2
+    assert clothing.get_balance() == 18
+
+
+def test_journal_recovers_unsnapshotted_entries(tmp_path):
+    journal = LedgerJournal(tmp_path, group_size=2)
+    food, clothing = journal.attach(Category("Food")), journal.attach(Category("Clothing"))
+    food.deposit(100, "deposit", timestamp=1.0)
+    food.withdraw(10.15, "groceries", timestamp=2.0)
+    food.transfer(50, clothing, timestamp=3.0)
+    journal.commit()
+
+    recovered = LedgerJournal.recover(tmp_path).categories
+    assert recovered["Food"].ledger == food.ledger
+    assert recovered["Clothing"].ledger == clothing.ledger
+    assert recovered["Food"].get_balance() == food.get_balance()
+    assert recovered["Food"].spending_since(2.0) == food.spending_since(2.0)
+
+
+def test_journal_recovers_after_checkpoint(tmp_path):
+    journal = LedgerJournal(tmp_path)
+    food = journal.attach(Category("Food"))
+    food.deposit(100, "deposit")
+    journal.checkpoint()
+    food.withdraw(25, "restaurant")
+    journal.close()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["journal-1.log", "manifest.json", "snapshot-1-0.bin"]
+    recovered = LedgerJournal.recover(tmp_path)
+    assert recovered.categories["Food"].ledger == food.ledger
+    recovered.categories["Food"].deposit(5, "refund")
+    recovered.close()
+    assert LedgerJournal.recover(tmp_path).categories["Food"].get_balance() == 80
+
+
+def test_journal_drops_torn_transaction(tmp_path):
+    journal = LedgerJournal(tmp_path)
+    food, clothing = journal.attach(Category("Food")), journal.attach(Category("Clothing"))
+    food.deposit(100, "deposit")
+    transfer_batch([(food, clothing, 10), (clothing, food, 5)])
+    journal.close()
+    log = tmp_path / "journal-0.log"
+    log.write_bytes(log.read_bytes()[:-7])
+
+    recovered = LedgerJournal.recover(tmp_path).categories
+    assert recovered["Food"].get_balance() == 100
+    assert "Clothing" not in recovered
+    assert log.read_bytes().count(b"\n") == 1
+
+
+def test_journal_rejects_duplicate_category_names(tmp_path):
+    journal = LedgerJournal(tmp_path)
+    journal.attach(Category("Food"))
+    with pytest.raises(InvalidCategoryError):
+        journal.attach(Category("Food"))
+
+
+def test_journal_reopened_keeps_its_categories(tmp_path):
+    journal = LedgerJournal(tmp_path)
+    journal.attach(Category("Food")).deposit(55, "deposit")
+    journal.checkpoint()
+    journal.close()
+
+    reopened = LedgerJournal(tmp_path)
+    assert reopened.categories["Food"].get_balance() == 55
+    reopened.attach(Category("Clothing")).deposit(1, "deposit")
+    reopened.checkpoint()
+    reopened.close()
+    recovered = LedgerJournal.recover(tmp_path).categories
+    assert {name: category.get_balance() for name, category in recovered.items()} == {"Food": 55, "Clothing": 1}
+
+
+def test_str_is_rendered_incrementally():
+    food = Category("Food")
+    food.deposit(10, "deposit")
+    assert str(food) == "*************Food*************\ndeposit                  10.00\nTotal: 10.0"
+    food.withdraw(2.5, "restaurant and more food for dessert")
+    assert str(food) == ("*************Food*************\ndeposit                  10.00\n"
+                         "restaurant and more food -2.50\nTotal: 7.5")
+    # a wider amount formats the earlier lines again
+    food.deposit(123456.78, "salary")
+    assert str(food) == ("*************Food*************\ndeposit                  10.00\n"
+                         "restaurant and more      -2.50\nsalary               123456.78\nTotal: 123464.28")
+    food.category = "Groceries"
+    assert str(food).startswith("**********Groceries***********\n")
+
+
+def test_spend_chart_rows_with_long_category_names():
+    short, long = Category("A"), Category("Entertainment")
+    for category, spending in [(short, 25), (long, 75)]:
+        category.deposit(100)
+        category.withdraw(spending)
+    rows = create_spend_chart([short, long]).split("\n")
+    assert len(rows) == 1 + 11 + 1 + len("Entertainment")
+    assert rows[3] == " 80|       "
+    assert rows[4] == " 70|    o  "
+    assert rows[9] == " 20| o  o  "
+    assert rows[12] == "    -------"
+    assert rows[13] == "     A  E  "
+    assert rows[-1] == "        t  "
+
+
+def test_ledger_lines_match_str():
+    food = Category("Food")
+    food.deposit(1000, "initial deposit")
+    food.withdraw(10.15, "groceries")
+    food.withdraw(15.89, "restaurant and more food for dessert")
+    lines = str(food).split("\n")[1:-1]
+    assert list(food.ledger_lines()) == lines
+    assert list(food.ledger_lines(offset=1, limit=1)) == lines[1:2]
+    assert food.ledger_page(1, page_size=2) == lines[2:]
+    assert food.ledger_page(2, page_size=2) == []
+
+
+@pytest.mark.parametrize("indexed", [False, True])
+def test_ledger_lines_filters(indexed):
+    food = Category("Food")
+    if indexed:
+        food.index_descriptions()
+    for i in range(30):
+        food.deposit(i, ["rent", "groceries", "gifts"][i % 3])
+    expected = [f"{description:23} {amount:6.2f}" for amount, description in
+                [(1, "groceries"), (2, "gifts"), (4, "groceries"), (5, "gifts"), (7, "groceries"), (8, "gifts")]]
+    assert list(food.ledger_lines(description_prefix="g", max_amount=8)) == expected
+    assert list(food.ledger_lines(offset=2, limit=3, description_prefix="g", max_amount=8)) == expected[2:5]
+    assert list(food.ledger_lines(description_prefix="gr", min_amount=25.5)) == [f"{'groceries':23} {28:6.2f}"]
+    assert list(food.ledger_lines(description_prefix="x")) == []
+
+
+def test_index_descriptions_merges_batches_of_unique_descriptions():
+    rng = random.Random(4)
+    food, unindexed = Category("Food"), Category("Food")
+    food.index_descriptions()
+    for batch in (5, 3000, 1, 500):
+        for _ in range(batch):
+            description = f"payment #{rng.randrange(10000)}"
+            food._append(100, description)
+            unindexed._append(100, description)
+        for prefix in ("payment #1", "payment #99", "payment #5000"):
+            assert list(food.ledger_lines(description_prefix=prefix)) == \
+                list(unindexed.ledger_lines(description_prefix=prefix))
+    assert food._sorted_descriptions == sorted(food._sorted_descriptions)
+
+
+def test_query_range_sums_and_counts():
+    rng = random.Random(3)
+    food = Category("Food")
+    amounts = [rng.randint(-5000, 5000) for _ in range(3000)]
+    for cents in amounts[:1000]:
+        food._append(cents, "entry")
+    query = food.query()
+    # entries appended after the indexes were built are added when they are used
+    for cents in amounts[1000:]:
+        food._append(cents, "entry")
+    for low, high in [(-10, 10), (-50, 0), (0.01, 50), (-100, 100)]:
+        inside = [cents for cents in amounts if round(low * 100) <= cents <= round(high * 100)]
+        assert query.sum_range(low, high) == sum(inside) / 100
+        assert query.count_range(low, high) == len(inside)
+    assert query.count_range() == 3000
+    assert query.sum_range(max_amount=0) == sum(cents for cents in amounts if cents <= 0) / 100
+    # a minimum above the maximum is an empty range, like in sum_ledger
+    assert query.sum_range(10, 5) == food.sum_ledger(10, 5) == 0
+    assert query.count_range(10, 5) == 0
+
+
+def test_query_top_spends_and_search():
+    food = Category("Food")
+    food.deposit(1000, "deposit")
+    food.withdraw(10.15, "Groceries")
+    food.withdraw(99.99, "restaurant")
+    food.withdraw(10.15, "groceries online")
+    food.withdraw(5, "gift")
+    query = food.query()
+    assert query.top_spends(3) == [{"amount": -99.99, "description": "restaurant"},
+                                   {"amount": -10.15, "description": "Groceries"},
+                                   {"amount": -10.15, "description": "groceries online"}]
+    assert len(query.top_spends(10)) == 4
+    assert [entry["description"] for entry in query.search("GROCER")] == ["Groceries", "groceries online"]
+    assert [entry["description"] for entry in query.search("t", limit=2)] == ["deposit", "restaurant"]
+    assert query.search("bakery") == []
+
+
+def test_query_sum_between_timestamps():
+    food = Category("Food")
+    for day in range(10):
+        food.deposit(day + 1, "deposit", timestamp=day * 86400.0)
+    assert food.query().sum_between(86400, 3 * 86400) == 5.0
+    query = food.query(timestamps=True)
+    food.withdraw(4, "lunch", timestamp=9.5 * 86400)
+    assert query.sum_between(since=8 * 86400) == 15.0
+    assert query.sum_between() == 51.0
+    assert query.sum_between(20 * 86400) == 0.0
+
+
+def test_aggregator_buckets_and_currencies():
+    # 2024-01-01 (a Monday) at noon UTC
+    monday = 1704110400.0
+    food, travel = Category("Food"), Category("Travel")
+    aggregator = SpendingAggregator("USD", rates={"EUR": 1.5})
+    aggregator.attach(food)
+    aggregator.attach(travel, "EUR")
+    food.deposit(1000, "deposit", timestamp=monday)
+    food.withdraw(10, "groceries", timestamp=monday)
+    food.withdraw(20, "groceries", timestamp=monday + 6 * 86400)
+    travel.deposit(1000, "deposit", timestamp=monday)
+    travel.withdraw(100, "train", timestamp=monday + 7 * 86400)
+
+    assert aggregator.spending("week") == {date(2024, 1, 1): {"Food": 30.0}, date(2024, 1, 8): {"Travel": 150.0}}
+    assert aggregator.spending("day", since=monday + 86400) == {date(2024, 1, 7): {"Food": 20.0},
+                                                                 date(2024, 1, 8): {"Travel": 150.0}}
+    # entries posted after a read are added at the next one, conversion happens when reading
+    food.withdraw(5, "snack", timestamp=monday + 40 * 86400)
+    aggregator.set_rate("EUR", 2)
+    assert aggregator.totals("month", until=monday + 30 * 86400) == {"Food": 30.0, "Travel": 200.0}
+    assert aggregator.spending("month", currency="EUR") == {date(2024, 1, 1): {"Food": 15.0, "Travel": 100.0},
+                                                            date(2024, 2, 1): {"Food": 2.5}}
+    with pytest.raises(InvalidCurrencyError):
+        aggregator.totals(currency="GBP")
+    with pytest.raises(InvalidCategoryError):
+        aggregator.attach(Category("Food"))
+
+
+def test_aggregator_spend_chart_matches_create_spend_chart():
+    categories = [Category(name) for name in ["Food", "Clothing", "Auto"]]
+    aggregator = SpendingAggregator()
+    for category, spending in zip(categories, [105.55, 33.40, 15]):
+        aggregator.attach(category)
+        category.deposit(1000, "deposit")
+        category.withdraw(spending)
+    assert aggregator.spend_chart() == create_spend_chart(categories)
+    assert aggregator.spend_chart(categories=["Auto", "Food"]) == create_spend_chart(categories[::-2])
+
+
+def test_amounts_are_parsed_to_exact_cents():
+    food = Category("Food")
+    food.deposit("0.10")
+    food.deposit(0.2)
+    assert food.withdraw(" 0.3 ", "exact")
+    assert food.get_balance() == 0.0
+    food.deposit("123456789012345.67")
+    assert food.ledger[-1]["amount"] == 123456789012345.67
+    assert food._balance_cents == 12345678901234567
+    for amount in ["", "abc", None, float("nan"), "-1", -0.001, "-0.004"]:
+        with pytest.raises(InvalidAmountError):
+            food.deposit(amount)
+    assert not food.transfer("123456789012345.68", Category("Clothing"))
+    food.deposit("36141799645785.27")
+    assert food.ledger[-1]["amount"] == 36141799645785.27
+    assert food._amounts[-1] == 3614179964578527
+    # amounts which don't fit in 64-bit cents are rejected and leave no orphan description behind
+    for amount in [10 ** 17, "1e20", -10 ** 17]:
+        with pytest.raises(InvalidAmountError):
+            food.deposit(amount, "too large")
+    with pytest.raises(OverflowError):
+        food._append(2 ** 63, "too large")
+    assert "too large" not in food._description_table
+    assert len(food._amounts) == len(food._descriptions) == len(food._timestamps)
+
+
+def test_transfer_with_old_timestamp_changes_nothing():
+    food, clothing = Category("Food"), Category("Clothing")
+    food.deposit(100, timestamp=10)
+    clothing.deposit(5, timestamp=50)
+    with pytest.raises(InvalidTimestampError):
+        food.transfer(20, clothing, timestamp=20)
+    assert food.get_balance() == 100
+    assert clothing.get_balance() == 5
+    assert len(food.ledger) == 1
+
+
+def test_transfer_batch_with_old_timestamp_changes_nothing():
+    food, clothing, auto = Category("Food"), Category("Clothing"), Category("Auto")
+    food.deposit(100, timestamp=10)
+    auto.deposit(5, timestamp=50)
+    with pytest.raises(InvalidTimestampError):
+        transfer_batch([(food, clothing, 10), (food, auto, 10)], timestamp=20)
+    assert [food.get_balance(), clothing.get_balance(), auto.get_balance()] == [100, 0, 5]
+
+
+def test_indexes_of_thread_safe_category_are_updated_once():
+    # switching threads as often as possible, the lazy index updates used to interleave
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    food = ThreadSafeCategory("Food")
+    food.query()
+    food.index_descriptions()
+    aggregator = SpendingAggregator()
+    aggregator.attach(food)
+    for i in range(20000):
+        food._append(i % 100, f"entry {i % 7}", float(i))
+    results, errors = [], []
+
+    def read():
+        try:
+            results.append((food.query().count_range(), len(food.ledger_page(0, 10, description_prefix="entry 1")),
+                            aggregator.totals()["Food"]))
+        except Exception as error:
+            errors.append(error)
+
+    try:
+        threads = [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert errors == []
+    assert results == [(20000, 10, 0.0)] * 4
+
+
+def test_journal_writes_a_lone_entry_after_flush_interval(tmp_path):
+    journal = LedgerJournal(tmp_path, flush_interval=0.01)
+    food = journal.attach(Category("Food"))
+    food.deposit(10, "deposit")
+    deadline = time.monotonic() + 5
+    while journal._buffer and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert journal._buffer == []
+    assert LedgerJournal.recover(tmp_path).categories["Food"].get_balance() == 10
+    journal.close()
+
+
+def test_journal_cancels_the_timer_of_a_written_group(tmp_path):
+    threads_before = threading.active_count()
+    journal = LedgerJournal(tmp_path, group_size=1, flush_interval=60)
+    food = journal.attach(Category("Food"))
+    for _ in range(2000):
+        food.deposit(1, "deposit")
+    # a cancelled timer thread ends right away, but not necessarily before the deposit returns
+    deadline = time.monotonic() + 5
+    while threading.active_count() > threads_before and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert threading.active_count() == threads_before
+    journal.close()
+
+
+def test_query_trees_follow_bucket_splits(monkeypatch):
+    monkeypatch.setattr(LedgerQuery, "_BUCKET_SIZE", 4)
+    rng = random.Random(5)
+    food = Category("Food")
+    query = food.query()
+    amounts = []
+    for _ in range(500):
+        amounts.append(rng.randint(-300, 300))
+        food._append(amounts[-1], "entry")
+        low, high = sorted(rng.randint(-400, 400) for _ in range(2))
+        inside = [cents for cents in amounts if low <= cents <= high]
+        assert query.sum_range(low / 100, high / 100) == sum(inside) / 100
+        assert query.count_range(low / 100, high / 100) == len(inside)
+    assert len(query._buckets) > 50
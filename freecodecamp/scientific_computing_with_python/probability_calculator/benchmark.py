@@ -0,0 +1,178 @@
+"""
+Benchmarks of the prob_calculator module with regression tracking.
+
+Usage:
+    python benchmark.py                      # run, print the results and compare them with benchmark_baseline.json
+    python benchmark.py --save-baseline      # run and store the results as the new baseline
+    python benchmark.py --module ../time_calculator/prob_calculator.py --output results.json
+
+The exit code is 1 when the throughput of any benchmark dropped by more than --threshold compared with the baseline.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import sys
+import time
+
+HAT_SIZES = [10, 1_000, 100_000, 1_000_000]
+COLOR_COUNTS = [3, 30]
+TRIAL_COUNTS = [100, 10_000]
+NUM_BALLS_DRAWN = 5
+MAX_DRAWS = 100
+DEFAULT_MODULE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "prob_calculator.py")
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+
+def load_module(path: str):
+    """
+    Imports a prob_calculator module from *path*, so any copy of it can be benchmarked.
+    """
+    spec = importlib.util.spec_from_file_location("benchmarked_prob_calculator", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def hat_arguments(num_balls: int, num_colors: int) -> dict:
+    """
+    Splits *num_balls* as evenly as possible into *num_colors* colors.
+    """
+    num_colors = min(num_colors, num_balls)
+    per_color, remainder = divmod(num_balls, num_colors)
+    return {f"color{i}": per_color + (i < remainder) for i in range(num_colors)}
+
+
+def best_time(function, repeat: int) -> float:
+    """
+    Runs *function* *repeat* times and returns the fastest run in seconds.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def draw_repeatedly(hat, num_draws: int):
+    """
+    Draws NUM_BALLS_DRAWN balls *num_draws* times from the same hat.
+    """
+    for _ in range(num_draws):
+        hat.draw(NUM_BALLS_DRAWN)
+
+
+def run_benchmarks(module, repeat: int = 3, max_seconds: float = 10.0, hat_sizes=None) -> dict:
+    """
+    Benchmarks Hat construction, Hat.draw and experiment for every combination of hat size, number of colors and
+    (for experiment) number of trials. Hat.draw is timed over up to MAX_DRAWS consecutive draws from one hat.
+    :param module: the prob_calculator module to benchmark
+    :param repeat: how many times every benchmark is run, the fastest run counts
+    :param max_seconds: benchmarks whose single run is estimated to take longer are skipped
+    :param hat_sizes: hat sizes to benchmark, HAT_SIZES by default
+    :return: dictionary of benchmark name: {"seconds", "throughput", "unit"} or {"skipped"}
+
+    Every benchmark of experiment is first run with one trial to estimate its duration, so slow implementations
+    (e.g. the one copying the hat for every trial) do not run for hours on the big hats.
+    """
+    hat_classes = [module.Hat] + ([module.CompactHat] if hasattr(module, "CompactHat") else [])
+    results = {}
+    for hat_class in hat_classes:
+        for num_balls in hat_sizes or HAT_SIZES:
+            for num_colors in COLOR_COUNTS:
+                arguments = hat_arguments(num_balls, num_colors)
+                case = f"{hat_class.__name__}/balls={num_balls}/colors={num_colors}"
+
+                seconds = best_time(lambda: hat_class(**arguments), repeat)
+                results[f"construct/{case}"] = {"seconds": seconds, "throughput": num_balls / seconds,
+                                                "unit": "balls/s"}
+
+                num_draws = min(MAX_DRAWS, num_balls // NUM_BALLS_DRAWN)
+                hats = [hat_class(**arguments) for _ in range(repeat)]
+                seconds = best_time(lambda: draw_repeatedly(hats.pop(), num_draws), repeat)
+                results[f"draw/{case}"] = {"seconds": seconds, "throughput": num_draws / seconds, "unit": "draws/s"}
+
+                hat = hat_class(**arguments)
+                expected_balls = dict.fromkeys(list(arguments)[:2], 1)
+                single_trial = best_time(lambda: module.experiment(hat, expected_balls, NUM_BALLS_DRAWN, 1), 1)
+                for num_trials in TRIAL_COUNTS:
+                    name = f"experiment/{case}/trials={num_trials}"
+                    if single_trial * num_trials > max_seconds:
+                        results[name] = {"skipped": f"estimated {single_trial * num_trials:.0f}s > {max_seconds}s"}
+                        continue
+                    seconds = best_time(lambda: module.experiment(hat, expected_balls, NUM_BALLS_DRAWN, num_trials),
+                                        repeat)
+                    results[name] = {"seconds": seconds, "throughput": num_trials / seconds, "unit": "trials/s"}
+    return results
+
+
+def compare_results(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Compares the throughput of every benchmark present in both *results* and *baseline*.
+    :param results: benchmark results returned by *run_benchmarks*
+    :param baseline: stored benchmark results
+    :param threshold: allowed relative drop of throughput, e.g. 0.2 for 20 %
+    :return: list of descriptions of the regressions, empty if there are none
+    """
+    regressions = []
+    for name, result in results.items():
+        stored = baseline.get(name)
+        if not stored or "throughput" not in result or "throughput" not in stored:
+            continue
+        ratio = result["throughput"] / stored["throughput"]
+        if ratio < 1 - threshold:
+            regressions.append(f"{name}: {result['throughput']:.6g} {result['unit']} is {1 - ratio:.0%} below "
+                               f"the baseline {stored['throughput']:.6g} {stored['unit']}")
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmarks of prob_calculator with regression tracking.")
+    parser.add_argument("--module", default=DEFAULT_MODULE, help="path of the prob_calculator.py to benchmark")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="path of the stored baseline results")
+    parser.add_argument("--output", help="write the results as JSON to this path")
+    parser.add_argument("--save-baseline", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed relative drop of throughput")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of every benchmark, the fastest counts")
+    parser.add_argument("--max-seconds", type=float, default=10.0, help="skip benchmarks estimated to be slower")
+    parser.add_argument("--quick", action="store_true", help="only benchmark hats of up to 1000 balls")
+    arguments = parser.parse_args(argv)
+
+    module = load_module(arguments.module)
+    hat_sizes = [size for size in HAT_SIZES if size <= 1_000] if arguments.quick else HAT_SIZES
+    report = {
+        "module": os.path.abspath(arguments.module),
+        "python": sys.version.split()[0],
+        "machine": platform.machine(),
+        "results": run_benchmarks(module, arguments.repeat, arguments.max_seconds, hat_sizes),
+    }
+    for name, result in report["results"].items():
+        if "throughput" in result:
+            print(f"{name:60} {result['throughput']:14.6g} {result['unit']}")
+        else:
+            print(f"{name:60} skipped: {result['skipped']}")
+
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(report, file, indent=2)
+    if arguments.save_baseline:
+        with open(arguments.baseline, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Baseline saved to {arguments.baseline}")
+        return 0
+    if not os.path.exists(arguments.baseline):
+        print(f"No baseline found at {arguments.baseline}, run with --save-baseline to create one.")
+        return 0
+
+    with open(arguments.baseline) as file:
+        baseline = json.load(file)
+    regressions = compare_results(report["results"], baseline["results"], arguments.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
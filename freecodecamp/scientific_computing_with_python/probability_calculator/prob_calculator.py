@@ -1,7 +1,19 @@
-import copy
+import math
+import os
 import random
-from collections import Counter
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from statistics import NormalDist
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ExperimentResult = namedtuple("ExperimentResult", ["probability", "interval", "num_experiments"])
+ExperimentSnapshot = namedtuple("ExperimentSnapshot", ["successes", "trials", "rng_state"])
+VarianceReducedResult = namedtuple("VarianceReducedResult", ["probability", "effective_sample_size", "num_experiments"])
 
 class Hat:
     def __init__(self, **args):
@@ -56,6 +68,113 @@ class Hat:
                 self.contents.remove(ball)
         return self.drawn_balls
 
+    def color_counts(self) -> dict:
+        """
+        Counts the balls of every color in the hat.
+        :return: dictionary of color (str): number of balls (int), only colors with at least one ball are included
+        """
+        return convert_list_to_dict(self.contents)
+
+
+class CompactHat(Hat):
+    def __init__(self, **args):
+        """
+        Initializes a Hat object which stores the number of balls of every color instead of a list of balls.
+
+        :param args: A variable number of keyword arguments
+                     key (str) is the color of the ball
+                     value (int) is the number of balls of that color
+
+        The *colors* list and the *counts* list are kept side by side, so the memory used by the hat is O(colors)
+        instead of O(balls) and a hat with millions of balls is as small as one with a few.
+        The *contents* list is only built when it is asked for (see the *contents* property).
+        """
+        self.drawn_balls = []
+        self.colors = []
+        self.counts = []
+        self._contents = None
+        if all(isinstance(num_of_balls, int) for num_of_balls in args.values()):
+            self.colors.extend(args.keys())
+            self.counts.extend(max(num_of_balls, 0) for num_of_balls in args.values())
+        else:
+            print(f"Error: invalid key or value entered {args.items() = }. Nothing will be added to the hat.")
+
+    def __str__(self):
+        return f"CompactHat({', '.join(f'{color}={count}' for color, count in zip(self.colors, self.counts))})"
+
+    def __repr__(self):
+        return self.__str__()
+
+    @property
+    def contents(self) -> list[str]:
+        """
+        The list of balls in the same form as *Hat.contents*. It is built lazily and cached until the next draw.
+        """
+        if self._contents is None:
+            self._contents = [color for color, count in zip(self.colors, self.counts) for _ in range(count)]
+        return self._contents
+
+    @contents.setter
+    def contents(self, new_contents: list[str]):
+        color_counts = convert_list_to_dict(new_contents)
+        self.colors = list(color_counts.keys())
+        self.counts = list(color_counts.values())
+        self._contents = None
+
+    def draw(self, num_balls_drawn: int) -> list[str]:
+        """
+        Picks balls at random from the hat and removes them (if possible).
+
+        :param num_balls_drawn: The number of balls to draw from the hat.
+                                When *num_balls_drawn* is greater than or equal to the total number of balls in the hat,
+                                the method removes all the balls from the hat.
+
+        :return drawn_balls: A list of strings representing the colors of the drawn balls in the order they were drawn.
+
+        The balls are drawn one by one with sequential conditional sampling over the counts (see *_draw_from_counts*),
+        so a draw costs O(num_balls_drawn * colors) no matter how many balls there are in the hat.
+        """
+        if num_balls_drawn >= sum(self.counts):
+            self.drawn_balls = self.contents
+            self.counts = [0] * len(self.counts)
+        else:
+            self.drawn_balls = _draw_from_counts(self.colors, self.counts, num_balls_drawn, random.random)
+        self._contents = None
+        return self.drawn_balls
+
+    def color_counts(self) -> dict:
+        """
+        Counts the balls of every color in the hat.
+        :return: dictionary of color (str): number of balls (int), only colors with at least one ball are included
+        """
+        return {color: count for color, count in zip(self.colors, self.counts) if count > 0}
+
+
+def _draw_from_counts(colors: list[str], counts: list[int], num_balls_drawn: int, random_float) -> list[str]:
+    """
+    Draws balls without replacement from a hat stored as per-color counts.
+    :param colors: the colors of the hat
+    :param counts: the number of balls of every color, the drawn balls are subtracted from it
+    :param num_balls_drawn: how many balls will be drawn, at most sum(counts)
+    :param random_float: function returning a random float in [0, 1), e.g. *random.random*
+    :return: list of the drawn colors in the order they were drawn
+
+    Every ball is drawn from the conditional distribution given the balls drawn before it: a random position among
+    the remaining balls is picked and the color whose block of the counts contains that position is drawn.
+    """
+    remaining_balls = sum(counts)
+    drawn_balls = []
+    for _ in range(num_balls_drawn):
+        position = int(random_float() * remaining_balls)
+        for color_index, count in enumerate(counts):
+            if position < count:
+                break
+            position -= count
+        counts[color_index] -= 1
+        remaining_balls -= 1
+        drawn_balls.append(colors[color_index])
+    return drawn_balls
+
 
 def experiment(hat: Hat, expected_balls: dict, num_balls_drawn: int, num_experiments: int) -> float:
     """
@@ -69,17 +188,35 @@ def experiment(hat: Hat, expected_balls: dict, num_balls_drawn: int, num_experim
 
     First data validation occurs. Num_of_balls must be an int as well as num_balls_drawn and num_experiment which are
     reset to 0 if incorrect data has been assigned.
-    The *copied_hat* is a copy of hat and will be used for the experiments, the original *hat* will be used to reset
-    the *copied_hat* before each experiment
+    The trials themselves are run by *count_successful_experiments*, which never copies or modifies the *hat*.
+
+    The *subset_of_dictionary* function returns True for a successful match. Each match adds 1 to the
+    successful_experiment variable.
 
-    The successful_experiment variable is reset before each experiment. The *subset_of_dictionary* function returns
-    True for a successful match. Each match adds 1 to the successful_experiment variable.
-    
     The *Counter* object is a subclass of dict class implemented in C that allows you to count the occurrences of
     elements in a list, which allows to efficiently compute *drawn_balls* *Counter object* (a dictionary) from the
-    *copied_hat.drawn_balls* list.
+    list of drawn balls.
     """
 
+    num_balls_drawn, num_experiments = _validate_experiment_arguments(expected_balls, num_balls_drawn,
+                                                                      num_experiments)
+    successful_experiment = count_successful_experiments(hat, expected_balls, num_balls_drawn, num_experiments)
+
+    if num_experiments == 0:
+        print(ZeroDivisionError(f"No experiments have been run"))
+        return 0
+    else:
+        return successful_experiment / num_experiments
+
+
+def _validate_experiment_arguments(expected_balls: dict, num_balls_drawn, num_experiments) -> tuple[int, int]:
+    """
+    Validates the arguments shared by all the experiment functions.
+    :param expected_balls: An expected dictionary of drawn balls, values which are not int are set to 0 in place
+    :param num_balls_drawn: how many balls will be drawn from the hat
+    :param num_experiments: how many times will the experiment be run
+    :return: num_balls_drawn and num_experiments converted to int, both reset to 0 if the conversion failed
+    """
     for num_of_balls in expected_balls.keys():
         if not isinstance(expected_balls[num_of_balls], int):
             print(TypeError(f"Error: invalid value entered: expected_balls={expected_balls}.\n"
@@ -95,19 +232,583 @@ def experiment(hat: Hat, expected_balls: dict, num_balls_drawn: int, num_experim
                         f"Setting num_balls_drawn and num_experiments to 0."))
         num_balls_drawn = 0
         num_experiments = 0
+    return num_balls_drawn, num_experiments
+
+
+def exact_probability(hat: Hat, expected_balls: dict, num_balls_drawn: int, max_states: int = 1_000_000,
+                      num_experiments: int = 100_000) -> float:
+    """
+    Calculates the exact probability which *experiment* estimates, falling back to *experiment* for too big problems.
+    :param hat: an instance of the class Hat, it is not modified
+    :param expected_balls: An expected dictionary of drawn balls for the experiment
+    :param num_balls_drawn: how many balls will be drawn from the hat
+    :param max_states: the largest dynamic programming state space solved exactly
+    :param num_experiments: how many experiments the fallback to *experiment* runs
+    :return: probability of drawing at least the *expected_balls* (exact unless the fallback was used)
+
+    Drawing *num_balls_drawn* balls is a multivariate hypergeometric draw, so the probability is the number of
+    successful draws divided by comb(all balls, num_balls_drawn). The successful draws are counted with dynamic
+    programming over the expected colors: *ways[j]* is the number of ways to pick j balls from the colors processed so
+    far with every one of them meeting its expected value. All the other colors are merged into one pool which is
+    added at the end. This takes about len(expected_balls) * num_balls_drawn ** 2 / 2 steps - when that is more than
+    *max_states*, the probability is estimated by *experiment* instead.
+
+    As in *subset_of_dictionary* an expected color has to be drawn at least once, even if its expected value is 0.
+    The binomial coefficients and the results are memoized, so repeated questions are answered from the cache.
+    """
+    num_balls_drawn, num_experiments = _validate_experiment_arguments(expected_balls, num_balls_drawn,
+                                                                      num_experiments)
+    hat_colors = hat.color_counts()
+    if any(color not in hat_colors for color in expected_balls):
+        return 0.0
+    total_balls = sum(hat_colors.values())
+    color_counts = tuple(hat_colors[color] for color in expected_balls)
+    expected_counts = tuple(max(number, 1) for number in expected_balls.values())
+    num_balls_drawn = max(min(num_balls_drawn, total_balls), 0)
+
+    if len(color_counts) * (num_balls_drawn + 1) ** 2 // 2 > max_states:
+        return experiment(hat, expected_balls, num_balls_drawn, num_experiments)
+    return _exact_probability(color_counts, expected_counts, total_balls - sum(color_counts), num_balls_drawn)
+
+
+@lru_cache(maxsize=None)
+def _binomial(n: int, k: int) -> int:
+    return math.comb(n, k)
+
+
+@lru_cache(maxsize=4096)
+def _exact_probability(color_counts: tuple, expected_counts: tuple, other_balls: int, num_balls_drawn: int) -> float:
+    """
+    The memoized dynamic programming part of *exact_probability*.
+    :param color_counts: number of balls of every expected color in the hat
+    :param expected_counts: the minimal number of drawn balls of every expected color
+    :param other_balls: number of balls of all the other colors
+    :param num_balls_drawn: how many balls are drawn, at most the number of balls in the hat
+    :return: exact probability
+    """
+    ways = [1] + [0] * num_balls_drawn
+    for color_count, expected_count in zip(color_counts, expected_counts):
+        new_ways = [0] * (num_balls_drawn + 1)
+        for already_drawn, num_ways in enumerate(ways):
+            if num_ways == 0:
+                continue
+            for drawn in range(expected_count, min(color_count, num_balls_drawn - already_drawn) + 1):
+                new_ways[already_drawn + drawn] += num_ways * _binomial(color_count, drawn)
+        ways = new_ways
+    successful_draws = sum(num_ways * _binomial(other_balls, num_balls_drawn - already_drawn)
+                           for already_drawn, num_ways in enumerate(ways))
+    return successful_draws / _binomial(sum(color_counts) + other_balls, num_balls_drawn)
+
+
+def experiment_vectorized(hat: Hat, expected_balls: dict, num_balls_drawn: int, num_experiments: int,
+                          batch_size: int = 100_000, seed=None) -> float:
+    """
+    Works like *experiment* but draws a whole batch of experiments at once with NumPy.
+    :param hat: an instance of the class Hat, it is not modified
+    :param expected_balls: An expected dictionary of drawn balls for the experiment
+    :param num_balls_drawn: how many balls will be drawn from the hat
+    :param num_experiments: how many times will the experiment be run
+    :param batch_size: how many experiments are drawn at once, bounds the memory to batch_size * number of colors
+    :param seed: seed for *numpy.random.default_rng*, the global *random.seed* has no effect here
+    :return: probability - number of successful experiments divided by the number of experiments performed
+
+    The colors are encoded as small integer codes: the expected colors get the codes 0..n-1 and all the other colors
+    are merged into one extra code, because their split does not change the outcome of the experiment.
+    *Generator.multivariate_hypergeometric* then draws a (batch_size, number of codes) array in which every row holds
+    the per-color counts of one experiment, and the subset test is done for the whole batch with one array compare.
+
+    As in *subset_of_dictionary* an expected color has to be drawn at least once, even if its expected value is 0.
+    """
+    if np is None:
+        raise ImportError("Error: experiment_vectorized requires numpy to be installed.")
+    num_balls_drawn, num_experiments = _validate_experiment_arguments(expected_balls, num_balls_drawn,
+                                                                      num_experiments)
+    if num_experiments == 0:
+        print(ZeroDivisionError(f"No experiments have been run"))
+        return 0
+    try:
+        batch_size = max(int(batch_size), 1)
+    except ValueError:
+        print(TypeError(f"Error: invalid value entered: {batch_size = }. Setting batch_size to 100000."))
+        batch_size = 100_000
+
+    hat_colors = hat.color_counts()
+    if any(color not in hat_colors for color in expected_balls):
+        return 0.0
+    total_balls = sum(hat_colors.values())
+    num_balls_drawn = max(num_balls_drawn, 0)
+    color_counts = [hat_colors[color] for color in expected_balls]
+    color_counts.append(total_balls - sum(color_counts))
+    color_counts = np.array(color_counts, dtype=np.int64)
+    expected_counts = np.array([max(number, 1) for number in expected_balls.values()], dtype=np.int64)
+    num_expected_colors = len(expected_counts)
 
+    if num_balls_drawn >= total_balls:
+        return float(np.all(color_counts[:num_expected_colors] >= expected_counts))
+
+    generator = np.random.default_rng(seed)
     successful_experiment = 0
+    for batch_start in range(0, num_experiments, batch_size):
+        batch = min(batch_size, num_experiments - batch_start)
+        drawn_counts = generator.multivariate_hypergeometric(color_counts, num_balls_drawn, size=batch)
+        successful_experiment += int(np.count_nonzero(
+            np.all(drawn_counts[:, :num_expected_colors] >= expected_counts, axis=1)))
+    return successful_experiment / num_experiments
+
+
+def experiment_adaptive(hat: Hat, expected_balls: dict, num_balls_drawn: int, half_width: float = 0.001,
+                        confidence: float = 0.95, batch_size: int = 10_000, max_experiments: int = 100_000_000,
+                        rng: random.Random = random) -> ExperimentResult:
+    """
+    Runs experiments in batches until the probability is known with the requested precision.
+    :param hat: an instance of the class Hat, it is not modified
+    :param expected_balls: An expected dictionary of drawn balls for the experiment
+    :param num_balls_drawn: how many balls will be drawn from the hat
+    :param half_width: the requested half-width of the confidence interval, e.g. 0.001 for +-0.001
+    :param confidence: confidence level of the interval, between 0 and 1
+    :param batch_size: how many experiments are run between two checks of the interval
+    :param max_experiments: upper limit of experiments, the result is returned even if the precision was not reached
+    :param rng: source of randomness, the module level *random* by default so *random.seed* keeps working
+    :return: ExperimentResult(probability, interval, num_experiments) where *interval* is the (low, high) Wilson score
+             interval and *num_experiments* is the number of experiments which were actually run
+
+    A fixed number of experiments is usually either too few or far too many: the number needed for a given precision
+    depends on the probability itself (p * (1 - p) / n is the variance of the estimate). After every batch the Wilson
+    score interval is updated and the experiments stop as soon as its half-width is at most *half_width*.
+    """
+    num_balls_drawn, max_experiments = _validate_experiment_arguments(expected_balls, num_balls_drawn,
+                                                                      max_experiments)
+    if not 0 < confidence < 1:
+        raise ValueError(f"Error: confidence must be between 0 and 1, {confidence = }")
+    if half_width <= 0:
+        raise ValueError(f"Error: half_width must be a positive number, {half_width = }")
+    batch_size = max(int(batch_size), 1)
+
+    successful_experiment = 0
+    num_experiments = 0
+    interval = (0.0, 1.0)
+    while num_experiments < max_experiments:
+        batch = min(batch_size, max_experiments - num_experiments)
+        successful_experiment += count_successful_experiments(hat, expected_balls, num_balls_drawn, batch, rng)
+        num_experiments += batch
+        interval = wilson_interval(successful_experiment, num_experiments, confidence)
+        if (interval[1] - interval[0]) / 2 <= half_width:
+            break
+    if num_experiments == 0:
+        print(ZeroDivisionError(f"No experiments have been run"))
+        return ExperimentResult(0, interval, 0)
+    return ExperimentResult(successful_experiment / num_experiments, interval, num_experiments)
+
+
+def wilson_interval(successes: int, trials: int, confidence: float = 0.95) -> tuple[float, float]:
+    """
+    Calculates the Wilson score confidence interval of a probability estimated from *successes* out of *trials*.
+    :param successes: number of successful experiments
+    :param trials: number of experiments, at least 1
+    :param confidence: confidence level of the interval, between 0 and 1
+    :return: (low, high) bounds of the interval
+
+    Unlike the simple p +- z * sqrt(p * (1 - p) / n) interval, the Wilson interval does not collapse to a single point
+    when no (or every) experiment succeeds, which matters for rare events.
+    """
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    z_squared = z * z
+    probability = successes / trials
+    denominator = 1 + z_squared / trials
+    center = (probability + z_squared / (2 * trials)) / denominator
+    spread = z * math.sqrt(probability * (1 - probability) / trials + z_squared / (4 * trials * trials)) / denominator
+    return max(center - spread, 0.0), min(center + spread, 1.0)
+
+
+def experiment_progress(hat: Hat, expected_balls: dict, num_balls_drawn: int, num_experiments: int,
+                        report_every: int = 100_000, seed=None, resume_from: ExperimentSnapshot = None):
+    """
+    Runs the experiments like *experiment* but yields the running results every *report_every* experiments.
+    :param hat: an instance of the class Hat, it is not modified
+    :param expected_balls: An expected dictionary of drawn balls for the experiment
+    :param num_balls_drawn: how many balls will be drawn from the hat
+    :param num_experiments: how many experiments will be run in total, including the resumed ones
+    :param report_every: number of experiments between two snapshots
+    :param seed: seed of the *random.Random* used by the experiments, ignored when resuming
+    :param resume_from: a snapshot yielded by an earlier run, the experiments continue from it
+    :return: generator of ExperimentSnapshot(successes, trials, rng_state), the last one covers all the experiments
+
+    The experiments are run in chunks of *report_every* by *count_successful_experiments*, so there is no extra work
+    per experiment - only one yield per chunk. Every snapshot holds the state of the random generator
+    (*random.Random.getstate*) after its chunk. A saved snapshot (e.g. pickled) can be passed back as *resume_from*
+    to continue the run, and with the same *report_every* the resumed run gives the same result as an
+    uninterrupted one.
+    """
+    num_balls_drawn, num_experiments = _validate_experiment_arguments(expected_balls, num_balls_drawn,
+                                                                      num_experiments)
+    report_every = max(int(report_every), 1)
+    rng = random.Random(seed)
+    successful_experiment = 0
+    trials = 0
+    if resume_from is not None:
+        rng.setstate(resume_from.rng_state)
+        successful_experiment = resume_from.successes
+        trials = resume_from.trials
+
+    while trials < num_experiments:
+        chunk = min(report_every, num_experiments - trials)
+        successful_experiment += count_successful_experiments(hat, expected_balls, num_balls_drawn, chunk, rng)
+        trials += chunk
+        yield ExperimentSnapshot(successful_experiment, trials, rng.getstate())
+
+
+def experiment_variance_reduced(hat: Hat, expected_balls: dict, num_balls_drawn: int, num_experiments: int,
+                                method: str = "importance", tilt: float = None,
+                                rng: random.Random = random) -> VarianceReducedResult:
+    """
+    Estimates the probability which *experiment* estimates with a variance reduction technique.
+    :param hat: an instance of the class Hat, it is not modified
+    :param expected_balls: An expected dictionary of drawn balls for the experiment
+    :param num_balls_drawn: how many balls will be drawn from the hat
+    :param num_experiments: how many experiments will be run
+    :param method: "stratified", "importance" or "antithetic"
+    :param tilt: only for "importance" - how many times more likely a ball of a still missing color is drawn,
+                 chosen automatically when None
+    :param rng: source of randomness, the module level *random* by default so *random.seed* keeps working
+    :return: VarianceReducedResult(probability, effective_sample_size, num_experiments)
+
+    All the methods draw the balls one by one from the per-color counts of the hat (sequential conditional sampling,
+    as in *_draw_from_counts*):
+    - "stratified" splits the experiments by the color of the first ball. Every color gets a share of the experiments
+      proportional to its balls, its first ball is fixed and the estimates are weighted by the color's share of the
+      hat, which removes the variance coming from the first ball.
+    - "importance" draws balls of the still missing colors *tilt* times more often and weights every successful
+      experiment by its likelihood ratio (the probability of its draws in the real hat divided by their probability in
+      the tilted one). This is the method for rare events - most experiments succeed, each with a tiny weight.
+    - "antithetic" runs the experiments in pairs: the second experiment of a pair uses 1 - u for every random number
+      u of the first one, so it picks from the other end of the colors and the two results are negatively correlated.
+
+    The *effective_sample_size* is the number of plain *experiment* runs which would give an estimate of the same
+    variance, p * (1 - p) / variance - the larger it is compared with *num_experiments*, the more the method helped.
+    """
+    num_balls_drawn, num_experiments = _validate_experiment_arguments(expected_balls, num_balls_drawn,
+                                                                      num_experiments)
+    if method not in ("stratified", "importance", "antithetic"):
+        raise ValueError(f"Error: unknown variance reduction method {method = }")
+    if num_experiments == 0:
+        print(ZeroDivisionError(f"No experiments have been run"))
+        return VarianceReducedResult(0, 0, 0)
+
+    hat_colors = hat.color_counts()
+    matcher = ExpectedBallsMatcher(expected_balls, hat_colors.keys())
+    counts = list(hat_colors.values())
+    total_balls = sum(counts)
+    if num_balls_drawn >= total_balls:
+        return VarianceReducedResult(float(matcher.matches(counts)), num_experiments, num_experiments)
+    if not matcher.is_possible(counts, num_balls_drawn):
+        return VarianceReducedResult(0.0, num_experiments, num_experiments)
+    if matcher.total_missing == 0:
+        return VarianceReducedResult(1.0, num_experiments, num_experiments)
+
+    random_float = rng.random
+    missing_balls = matcher.missing_balls
+    if method == "stratified":
+        probability = 0.0
+        variance = 0.0
+        num_run = 0
+        for color_index, color_count in enumerate(counts):
+            if color_count == 0:
+                continue
+            stratum_weight = color_count / total_balls
+            stratum_experiments = max(round(num_experiments * stratum_weight), 1)
+            stratum_counts = counts.copy()
+            stratum_counts[color_index] -= 1
+            stratum_missing = missing_balls.copy()
+            if stratum_missing[color_index]:
+                stratum_missing[color_index] -= 1
+            successes = sum(_count_experiment_succeeds(stratum_counts.copy(), stratum_missing.copy(),
+                                                       num_balls_drawn - 1, random_float)
+                            for _ in range(stratum_experiments))
+            stratum_probability = successes / stratum_experiments
+            probability += stratum_weight * stratum_probability
+            variance += stratum_weight ** 2 * stratum_probability * (1 - stratum_probability) / stratum_experiments
+            num_run += stratum_experiments
+        return VarianceReducedResult(probability, _effective_sample_size(probability, variance, num_run), num_run)
+
+    if method == "antithetic":
+        num_pairs = (num_experiments + 1) // 2
+        pair_means = []
+        for _ in range(num_pairs):
+            uniforms = [random_float() for _ in range(num_balls_drawn)]
+            first = _count_experiment_succeeds(counts.copy(), missing_balls.copy(), num_balls_drawn,
+                                               iter(uniforms).__next__)
+            second = _count_experiment_succeeds(counts.copy(), missing_balls.copy(), num_balls_drawn,
+                                                iter([1 - uniform for uniform in uniforms]).__next__)
+            pair_means.append((first + second) / 2)
+        probability, variance = _mean_and_variance_of_mean(pair_means)
+        return VarianceReducedResult(probability, _effective_sample_size(probability, variance, 2 * num_pairs),
+                                     2 * num_pairs)
+
+    if tilt is None:
+        tilt = _automatic_tilt(counts, missing_balls, num_balls_drawn)
+    weights = []
     for _ in range(num_experiments):
-        copied_hat = copy.deepcopy(hat)
-        copied_hat.draw(num_balls_drawn)
-        drawn_balls = convert_list_to_dict(copied_hat.drawn_balls)
-        successful_experiment += subset_of_dictionary(drawn_balls, expected_balls)
+        remaining_counts = counts.copy()
+        missing = missing_balls.copy()
+        still_missing = matcher.total_missing
+        likelihood_ratio = 1.0
+        for _ in range(num_balls_drawn):
+            tilted_balls = sum(count * (tilt if missing[index] else 1) for index, count in enumerate(remaining_counts))
+            remaining_balls = sum(remaining_counts)
+            position = random_float() * tilted_balls
+            for color_index, count in enumerate(remaining_counts):
+                tilted_count = count * (tilt if missing[color_index] else 1)
+                if position < tilted_count:
+                    break
+                position -= tilted_count
+            while remaining_counts[color_index] == 0:
+                color_index -= 1
+            likelihood_ratio *= tilted_balls / (remaining_balls * (tilt if missing[color_index] else 1))
+            remaining_counts[color_index] -= 1
+            if missing[color_index]:
+                missing[color_index] -= 1
+                still_missing -= 1
+                if not still_missing:
+                    break
+        weights.append(likelihood_ratio if not still_missing else 0.0)
+    probability, variance = _mean_and_variance_of_mean(weights)
+    return VarianceReducedResult(probability, _effective_sample_size(probability, variance, num_experiments),
+                                 num_experiments)
+
+
+def _count_experiment_succeeds(counts: list[int], missing: list[int], num_balls_drawn: int, random_float) -> bool:
+    """
+    Runs one experiment with sequential conditional sampling over the per-color *counts* (both lists are modified).
+    :param counts: number of balls per color index in the hat
+    :param missing: number of balls per color index which still have to be drawn
+    :param num_balls_drawn: how many balls will be drawn
+    :param random_float: function returning the random floats in [0, 1) used for the draws
+    :return: True if nothing was missing after the draws
+    """
+    still_missing = sum(missing)
+    remaining_balls = sum(counts)
+    for balls_left in range(num_balls_drawn - 1, -1, -1):
+        if not still_missing:
+            return True
+        position = int(random_float() * remaining_balls)
+        for color_index, count in enumerate(counts):
+            if position < count:
+                break
+            position -= count
+        counts[color_index] -= 1
+        remaining_balls -= 1
+        if missing[color_index]:
+            missing[color_index] -= 1
+            still_missing -= 1
+        if still_missing > balls_left:
+            return False
+    return not still_missing
+
+
+def _automatic_tilt(counts: list[int], missing_balls: list[int], num_balls_drawn: int) -> float:
+    """
+    Chooses the importance sampling tilt so that the first drawn ball is of a missing color with a probability of
+    (number of missing balls / num_balls_drawn) - the share the missing balls need among the drawn ones - but at most
+    0.95. Returns 1 (no tilt) if the hat already gives them that share.
+    """
+    missing_color_balls = sum(count for count, missing in zip(counts, missing_balls) if missing)
+    other_balls = sum(counts) - missing_color_balls
+    target = min(sum(missing_balls) / num_balls_drawn, 0.95)
+    if other_balls == 0 or missing_color_balls / (missing_color_balls + other_balls) >= target:
+        return 1.0
+    return target * other_balls / (missing_color_balls * (1 - target))
+
+
+def _mean_and_variance_of_mean(values: list[float]) -> tuple[float, float]:
+    mean = math.fsum(values) / len(values)
+    if len(values) < 2:
+        return mean, 0.0
+    return mean, math.fsum((value - mean) ** 2 for value in values) / (len(values) - 1) / len(values)
+
+
+def _effective_sample_size(probability: float, variance: float, num_experiments: int) -> float:
+    """
+    Number of plain Monte Carlo experiments with the same variance as the estimate, p * (1 - p) / variance.
+    """
+    if variance == 0:
+        return float(num_experiments) if probability in (0, 1) else math.inf
+    return probability * (1 - probability) / variance
 
+
+def experiment_parallel(hat: Hat, expected_balls: dict, num_balls_drawn: int, num_experiments: int,
+                        seed=0, workers: int = None) -> float:
+    """
+    Works like *experiment* but splits the experiments across a pool of processes.
+    :param hat: an instance of the class Hat, it is not modified
+    :param expected_balls: An expected dictionary of drawn balls for the experiment
+    :param num_balls_drawn: how many balls will be drawn from the hat
+    :param num_experiments: how many times will the experiment be run
+    :param seed: the user seed all the worker streams are derived from, the global *random.seed* has no effect here
+    :param workers: number of worker processes (and shards), *os.cpu_count()* by default
+    :return: probability - number of successful experiments divided by the number of experiments performed
+
+    The experiments are split into *workers* shards which differ in size by at most one. Every shard runs
+    *count_successful_experiments* with its own *random.Random* seeded with the string "{seed}:{shard}" - string seeds
+    are hashed with SHA-512 by *random.seed*, so the streams are independent of each other and of PYTHONHASHSEED.
+    Because the shards do not depend on which process runs them or when, the same (seed, workers) pair always gives
+    a bit-identical result. With one worker the shard is run in the current process.
+
+    On platforms which start processes with "spawn" (Windows, macOS) the call has to be made from under
+    *if __name__ == "__main__":*.
+    """
+    num_balls_drawn, num_experiments = _validate_experiment_arguments(expected_balls, num_balls_drawn,
+                                                                      num_experiments)
     if num_experiments == 0:
         print(ZeroDivisionError(f"No experiments have been run"))
         return 0
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(min(int(workers), num_experiments), 1)
+
+    shard_size, remainder = divmod(num_experiments, workers)
+    shards = [(hat, expected_balls, num_balls_drawn, shard_size + (shard < remainder), f"{seed}:{shard}")
+              for shard in range(workers)]
+    if workers == 1:
+        successful_experiment = _run_experiment_shard(shards[0])
     else:
-        return successful_experiment / num_experiments
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            successful_experiment = sum(executor.map(_run_experiment_shard, shards))
+    return successful_experiment / num_experiments
+
+
+def _run_experiment_shard(shard: tuple) -> int:
+    """
+    Runs one shard of *experiment_parallel* in a worker process.
+    :param shard: tuple of (hat, expected_balls, num_balls_drawn, num_experiments, shard_seed)
+    :return: number of successful experiments in the shard
+    """
+    hat, expected_balls, num_balls_drawn, num_experiments, shard_seed = shard
+    return count_successful_experiments(hat, expected_balls, num_balls_drawn, num_experiments,
+                                        random.Random(shard_seed))
+
+
+def count_successful_experiments(hat: Hat, expected_balls: dict, num_balls_drawn: int, num_experiments: int,
+                                 rng: random.Random = random) -> int:
+    """
+    Runs *num_experiments* draws from the *hat* and counts how many of them contained the *expected_balls*.
+    :param hat: an instance of the class Hat, it is not modified
+    :param expected_balls: An expected dictionary of drawn balls for the experiment
+    :param num_balls_drawn: how many balls will be drawn from the hat in each experiment
+    :param num_experiments: how many times will the experiment be run
+    :param rng: source of randomness, the module level *random* by default so *random.seed* keeps working
+    :return: number of successful experiments
+
+    Instead of copying the hat for every experiment, the balls are encoded once as color indices into the *balls*
+    buffer and each experiment does a partial Fisher-Yates shuffle on it: for every drawn ball a random position from
+    the not yet drawn part of the buffer is swapped to the front, so after *num_balls_drawn* swaps the front of the
+    buffer holds the drawn balls. The buffer is never reset - it always stays a permutation of the hat contents and a
+    partial shuffle of any permutation is just as random - so one experiment costs O(num_balls_drawn) instead of
+    O(len(hat.contents)) for the copy plus O(num_balls_drawn * len(hat.contents)) for the *list.remove* calls.
+
+    The drawn balls are checked by an *ExpectedBallsMatcher* while they are drawn: every drawn ball of an expected
+    color lowers that color's *missing_balls* entry, so the experiment succeeds when nothing is missing at the end and
+    no dictionary is built per experiment. The buffer experiments always draw all *num_balls_drawn* balls, so the
+    random numbers used (and the results for a given *random.seed*) stay the same as before the matcher was added.
+
+    A *CompactHat* is not expanded into a buffer, every experiment draws from a copy of its counts instead (the same
+    sequential conditional sampling as in *_draw_from_counts*, done by *_count_experiment_succeeds*), so the memory
+    stays O(colors). As the drawing is O(colors) per ball there, those experiments stop as soon as nothing is missing
+    (success) or more balls are missing than are left to draw (failure) - the balls which were not drawn would not
+    change the outcome.
+
+    When *num_balls_drawn* is greater than or equal to the number of balls, every experiment draws the whole hat
+    (the same as *Hat.draw*) so the result is the same for all of them.
+    """
+    if num_experiments <= 0:
+        return 0
+    hat_colors = hat.color_counts()
+    matcher = ExpectedBallsMatcher(expected_balls, hat_colors.keys())
+    counts = list(hat_colors.values())
+    total_balls = sum(counts)
+    if num_balls_drawn >= total_balls:
+        return num_experiments * matcher.matches(counts)
+    if not matcher.is_possible(counts, num_balls_drawn):
+        return 0
+    if matcher.total_missing == 0:
+        return num_experiments
+
+    random_float = rng.random
+    missing_balls = matcher.missing_balls
+    total_missing = matcher.total_missing
+    successful_experiment = 0
+    if isinstance(hat, CompactHat):
+        for _ in range(num_experiments):
+            successful_experiment += _count_experiment_succeeds(counts.copy(), missing_balls.copy(), num_balls_drawn,
+                                                                random_float)
+        return successful_experiment
+
+    balls = matcher.encode(hat.contents)
+    for _ in range(num_experiments):
+        missing = missing_balls.copy()
+        still_missing = total_missing
+        for position in range(num_balls_drawn):
+            swap_with = position + int(random_float() * (total_balls - position))
+            ball = balls[swap_with]
+            balls[swap_with] = balls[position]
+            balls[position] = ball
+            if missing[ball]:
+                missing[ball] -= 1
+                still_missing -= 1
+        successful_experiment += not still_missing
+    return successful_experiment
+
+
+class ExpectedBallsMatcher:
+    def __init__(self, expected_balls: dict, colors):
+        """
+        Compiles the *expected_balls* dictionary against the colors of a hat, so the experiments can be checked with
+        a few compares on integer lists instead of building a dictionary for every experiment.
+
+        :param expected_balls: An expected dictionary of drawn balls for the experiment
+        :param colors: the colors of the hat, their positions become the dense color indices
+
+        *missing_balls[i]* is the number of balls of the color with index i which have to be drawn. As in
+        *subset_of_dictionary* an expected color has to be drawn at least once, even if its expected value is 0.
+        An expected color which is not in the hat can never be drawn, so *possible* is set to False.
+        """
+        self.colors = list(colors)
+        self.color_index = {color: index for index, color in enumerate(self.colors)}
+        self.missing_balls = [0] * len(self.colors)
+        self.possible = True
+        for color, num_of_balls in expected_balls.items():
+            if color in self.color_index:
+                self.missing_balls[self.color_index[color]] = max(num_of_balls, 1)
+            else:
+                self.possible = False
+        self.total_missing = sum(self.missing_balls)
+        self.requirements = [(index, missing) for index, missing in enumerate(self.missing_balls) if missing]
+
+    def __repr__(self):
+        return f"ExpectedBallsMatcher({dict(zip(self.colors, self.missing_balls))}, possible={self.possible})"
+
+    def encode(self, balls: list[str]) -> list[int]:
+        """
+        Converts a list of balls to the list of their color indices.
+        """
+        color_index = self.color_index
+        return [color_index[ball] for ball in balls]
+
+    def matches(self, counts: list[int]) -> bool:
+        """
+        Checks the drawn balls given as the number of drawn balls of every color index.
+        :param counts: number of drawn balls per color index
+        :return: True if at least the expected balls were drawn
+        """
+        return self.possible and all(counts[index] >= missing for index, missing in self.requirements)
+
+    def is_possible(self, counts: list[int], num_balls_drawn: int) -> bool:
+        """
+        Checks if an experiment can succeed at all.
+        :param counts: number of balls per color index in the hat
+        :param num_balls_drawn: how many balls will be drawn from the hat
+        :return: False if the expected balls are not in the hat or more balls are expected than will be drawn
+        """
+        return self.matches(counts) and self.total_missing <= num_balls_drawn
 
 
 def subset_of_dictionary(big_dictionary: dict, small_dictionary: dict) -> bool:
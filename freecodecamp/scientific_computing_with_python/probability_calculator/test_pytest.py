@@ -0,0 +1,193 @@
+import random
+
+import pytest
+
+from benchmark import compare_results, hat_arguments
+from prob_calculator import (CompactHat, ExpectedBallsMatcher, Hat, count_successful_experiments, exact_probability,
+                             experiment, experiment_adaptive, experiment_parallel, experiment_progress,
+                             experiment_variance_reduced, experiment_vectorized, wilson_interval)
+
+
+def test_count_successful_experiments_keeps_hat_untouched():
+    hat = Hat(blue=3, red=2, green=6)
+    count_successful_experiments(hat, {"blue": 2, "green": 1}, 4, 100, random.Random(1))
+    assert hat.contents == ["blue"] * 3 + ["red"] * 2 + ["green"] * 6
+
+
+def test_count_successful_experiments_estimate():
+    # exact probability is 87 / 330 = 0.2636...
+    hat = Hat(blue=3, red=2, green=6)
+    successes = count_successful_experiments(hat, {"blue": 2, "green": 1}, 4, 20000, random.Random(2))
+    assert abs(successes / 20000 - 87 / 330) < 0.015
+
+
+def test_count_successful_experiments_draws_whole_hat():
+    hat = Hat(yellow=5, red=1, green=3, blue=9, test=1)
+    assert count_successful_experiments(hat, {"yellow": 2, "blue": 3, "test": 1}, 20, 50) == 50
+    assert count_successful_experiments(hat, {"yellow": 6}, 20, 50) == 0
+
+
+def test_experiment_vectorized_matches_loop():
+    pytest.importorskip("numpy")
+    hat = Hat(blue=3, red=2, green=6)
+    probability = experiment_vectorized(hat, {"blue": 2, "green": 1}, 4, 200000, batch_size=30000, seed=3)
+    assert abs(probability - 87 / 330) < 0.005
+
+
+def test_experiment_vectorized_edge_cases():
+    pytest.importorskip("numpy")
+    hat = Hat(yellow=5, red=1, green=3, blue=9, test=1)
+    assert experiment_vectorized(hat, {"yellow": 2, "blue": 3, "test": 1}, 20, 100) == 1.0
+    assert experiment_vectorized(hat, {"pink": 1}, 4, 100) == 0.0
+    assert experiment_vectorized(hat, {"yellow": 1}, -3, 100) == experiment(hat, {"yellow": 1}, -3, 100) == 0.0
+
+
+def test_experiment_parallel_is_reproducible():
+    hat = Hat(blue=3, red=2, green=6)
+    first = experiment_parallel(hat, {"blue": 2, "green": 1}, 4, 20000, seed=7, workers=2)
+    second = experiment_parallel(hat, {"blue": 2, "green": 1}, 4, 20000, seed=7, workers=2)
+    assert first == second
+    assert abs(first - 87 / 330) < 0.015
+
+
+def test_experiment_parallel_single_worker_runs_inline():
+    hat = Hat(blue=3, red=2, green=6)
+    probability = experiment_parallel(hat, {"blue": 2, "green": 1}, 4, 1000, seed=7, workers=1)
+    successes = count_successful_experiments(hat, {"blue": 2, "green": 1}, 4, 1000, random.Random("7:0"))
+    assert probability == successes / 1000
+
+
+def test_exact_probability():
+    hat = Hat(blue=3, red=2, green=6)
+    assert exact_probability(hat, {"blue": 2, "green": 1}, 4) == 87 / 330
+    assert exact_probability(hat, {"blue": 3, "red": 2, "green": 6}, 20) == 1.0
+    assert exact_probability(hat, {"pink": 1}, 4) == 0.0
+    # a zero expected value still requires the color to be drawn, like subset_of_dictionary
+    assert exact_probability(hat, {"red": 0}, 1) == 2 / 11
+
+
+def test_exact_probability_falls_back_to_experiment():
+    random.seed(5)
+    hat = Hat(blue=3, red=2, green=6)
+    probability = exact_probability(hat, {"blue": 2, "green": 1}, 4, max_states=1, num_experiments=20000)
+    assert probability != 87 / 330
+    assert abs(probability - 87 / 330) < 0.015
+
+
+def test_compact_hat_contents_and_draw():
+    hat = CompactHat(red=3, blue=2)
+    assert hat.contents == ["red", "red", "red", "blue", "blue"]
+    drawn_balls = hat.draw(2)
+    assert len(drawn_balls) == 2
+    assert sorted(hat.contents + drawn_balls) == ["blue", "blue", "red", "red", "red"]
+    assert hat.draw(10) == hat.drawn_balls
+    assert hat.contents == []
+
+
+def test_compact_hat_memory_does_not_grow_with_balls():
+    hat = CompactHat(blue=10_000_000, red=5_000_000)
+    assert hat.color_counts() == {"blue": 10_000_000, "red": 5_000_000}
+    assert len(hat.draw(5)) == 5
+    assert sum(hat.counts) == 15_000_000 - 5
+
+
+def test_compact_hat_experiments():
+    hat = CompactHat(blue=3, red=2, green=6)
+    assert exact_probability(hat, {"blue": 2, "green": 1}, 4) == 87 / 330
+    successes = count_successful_experiments(hat, {"blue": 2, "green": 1}, 4, 20000, random.Random(2))
+    assert abs(successes / 20000 - 87 / 330) < 0.015
+    assert hat.counts == [3, 2, 6]
+
+
+def test_wilson_interval():
+    low, high = wilson_interval(50, 100)
+    assert abs(low - 0.4038) < 1e-4 and abs(high - 0.5962) < 1e-4
+    low, high = wilson_interval(0, 100)
+    assert low == 0.0 and 0 < high < 0.04
+
+
+def test_experiment_adaptive_stops_at_requested_precision():
+    hat = Hat(blue=3, red=2, green=6)
+    result = experiment_adaptive(hat, {"blue": 2, "green": 1}, 4, half_width=0.01, batch_size=1000,
+                                 rng=random.Random(4))
+    low, high = result.interval
+    assert (high - low) / 2 <= 0.01
+    assert low <= result.probability <= high
+    assert abs(result.probability - 87 / 330) < 0.02
+    assert result.num_experiments < 100_000
+
+
+def test_experiment_adaptive_respects_max_experiments():
+    hat = Hat(blue=3, red=2, green=6)
+    result = experiment_adaptive(hat, {"blue": 2, "green": 1}, 4, half_width=0.0001, batch_size=300,
+                                 max_experiments=1000, rng=random.Random(4))
+    assert result.num_experiments == 1000
+
+
+def test_experiment_progress_snapshots():
+    hat = Hat(blue=3, red=2, green=6)
+    snapshots = list(experiment_progress(hat, {"blue": 2, "green": 1}, 4, 2500, report_every=1000, seed=1))
+    assert [snapshot.trials for snapshot in snapshots] == [1000, 2000, 2500]
+    assert snapshots[0].successes <= snapshots[1].successes <= snapshots[2].successes
+
+
+def test_experiment_progress_resumes_from_snapshot():
+    hat = Hat(blue=3, red=2, green=6)
+    uninterrupted = list(experiment_progress(hat, {"blue": 2, "green": 1}, 4, 3000, report_every=1000, seed=1))
+    resumed = list(experiment_progress(hat, {"blue": 2, "green": 1}, 4, 3000, report_every=1000,
+                                       resume_from=uninterrupted[0]))
+    assert resumed == uninterrupted[1:]
+
+
+def test_expected_balls_matcher():
+    matcher = ExpectedBallsMatcher({"blue": 2, "green": 0}, ["blue", "red", "green"])
+    assert matcher.encode(["green", "blue", "red"]) == [2, 0, 1]
+    assert matcher.missing_balls == [2, 0, 1]
+    assert matcher.matches([2, 0, 1])
+    assert not matcher.matches([2, 5, 0])
+    assert matcher.is_possible([3, 2, 6], 3)
+    assert not matcher.is_possible([3, 2, 6], 2)
+    assert not ExpectedBallsMatcher({"pink": 1}, ["blue"]).is_possible([3], 3)
+
+
+@pytest.mark.parametrize("method", ["stratified", "importance", "antithetic"])
+def test_experiment_variance_reduced(method):
+    hat = Hat(blue=3, red=2, green=6)
+    result = experiment_variance_reduced(hat, {"blue": 2, "green": 1}, 4, 20000, method=method, rng=random.Random(1))
+    assert abs(result.probability - 87 / 330) < 0.015
+    assert result.num_experiments >= 20000
+    assert result.effective_sample_size > 0
+
+
+def test_experiment_variance_reduced_rare_event():
+    hat = Hat(blue=5, red=500, green=600)
+    exact = exact_probability(hat, {"blue": 5}, 30)
+    result = experiment_variance_reduced(hat, {"blue": 5}, 30, 5000, method="importance", rng=random.Random(1))
+    assert abs(result.probability - exact) / exact < 0.1
+    assert result.effective_sample_size > 1_000_000
+
+
+@pytest.mark.parametrize("method", ["stratified", "importance", "antithetic"])
+def test_experiment_variance_reduced_without_expected_balls(method):
+    result = experiment_variance_reduced(Hat(blue=3, red=2), {}, 0, 10, method=method)
+    assert result.probability == 1.0
+
+
+def test_experiment_variance_reduced_unknown_method():
+    with pytest.raises(ValueError):
+        experiment_variance_reduced(Hat(blue=1), {"blue": 1}, 1, 10, method="quasi")
+
+
+def test_benchmark_hat_arguments():
+    assert hat_arguments(10, 3) == {"color0": 4, "color1": 3, "color2": 3}
+    assert hat_arguments(2, 30) == {"color0": 1, "color1": 1}
+
+
+def test_benchmark_compare_results():
+    baseline = {"a": {"throughput": 100.0, "unit": "trials/s"}, "b": {"throughput": 100.0, "unit": "trials/s"},
+                "c": {"skipped": "slow"}}
+    results = {"a": {"throughput": 85.0, "unit": "trials/s"}, "b": {"throughput": 70.0, "unit": "trials/s"},
+               "c": {"throughput": 1.0, "unit": "trials/s"}, "d": {"throughput": 1.0, "unit": "trials/s"}}
+    regressions = compare_results(results, baseline, 0.2)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("b: 70 trials/s is 30% below")